@@ -0,0 +1,79 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import Union
+from agents.pubmed_searcher import PubmedSearcher
+from agents.query_validator import QueryValidator
+from agents.search_refiner import SearchRefiner
+from utils.llm_cache import get_llm_cache
+from utils.llm_interface import PROVIDERS, LLMRouter, close_llm_router, get_llm_router, route_specs
+from utils.pubmed_api import PubmedAPI, close_pubmed_api, get_pubmed_api
+from utils.pubmed_mirror import LocalPubmedAPI
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class AppContext:
+    """
+    Estado compartilhado por todas as requisições de um processo: cliente PubMed (pool de
+    conexões, rate limiter e caches), roteador de LLM e os agentes já construídos sobre eles.
+    Criado uma vez por worker, na inicialização, e fechado no encerramento.
+    """
+    api: Union[PubmedAPI, LocalPubmedAPI]
+    router: LLMRouter
+    validator: QueryValidator
+    searcher: PubmedSearcher
+    refiner: SearchRefiner
+
+    @staticmethod
+    def check_config():
+        """
+        Verifica, sem construir clientes, a configuração exigida por create(): PUBMED_EMAIL
+        (dispensada com o espelho local) e ao menos um provedor com chave de API em cada rota
+        de LLM. Levanta ValueError com a primeira pendência.
+        """
+        if not os.getenv("PUBMED_MIRROR_PATH") and not os.getenv("PUBMED_EMAIL"):
+            raise ValueError("PUBMED_EMAIL não definida no .env (ou defina PUBMED_MIRROR_PATH)")
+        for task, specs in route_specs().items():
+            if not any(os.getenv(PROVIDERS[spec.provider][1]) for spec in specs):
+                keys = sorted({PROVIDERS[spec.provider][1] for spec in specs})
+                raise ValueError(f"Nenhum provedor de LLM disponível para {task}; defina {' ou '.join(keys)}")
+
+    @classmethod
+    def create(cls):
+        """
+        Constrói clientes, caches e agentes. Levanta ValueError se faltar configuração
+        (PUBMED_EMAIL, quando não há espelho local, ou chave de API de algum provedor de LLM).
+        """
+        api = get_pubmed_api()
+        router = get_llm_router()
+        get_llm_cache()
+        context = cls(
+            api=api,
+            router=router,
+            validator=QueryValidator(router),
+            searcher=PubmedSearcher(api),
+            refiner=SearchRefiner(router),
+        )
+        logger.info("Contexto da aplicação inicializado")
+        return context
+
+    def agents(self):
+        """
+        Agentes no formato aceito por iter_search/run_search (validator, searcher, refiner).
+        """
+        return {"validator": self.validator, "searcher": self.searcher, "refiner": self.refiner}
+
+    def readiness(self):
+        """
+        Verificações baratas de prontidão, sem chamadas externas: {componente: ok}. "llm_routes"
+        exige, em cada rota, ao menos um modelo fora da quarentena após falha.
+        """
+        routes_ok = all(
+            any(not provider.cooling_down for provider in providers) for providers in self.router.routes.values()
+        )
+        return {**self.api.health(), "llm_routes": routes_ok}
+
+    async def aclose(self):
+        await close_pubmed_api()
+        await close_llm_router()
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+from agents.query_validator import QueryValidationError, QueryValidator
+from agents.pubmed_searcher import PubmedSearcher
+from agents.search_pipeline import MAX_CANDIDATES, MAX_INITIAL_ITERATIONS, run_search
+from agents.search_refiner import SearchRefiner
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional (saída em Parquet)
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+DONE = "done"
+INVALID = "invalid"
+FAILED = "failed"
+
+PARQUET_COLUMNS = [
+    "id", "picott_text", "status", "query", "total_count", "total_results", "iterations", "stop_reason", "error", "results",
+]
+
+MAX_BATCH_CONCURRENCY = 16
+
+def _bounded_int(value, name, index, upper):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Pergunta {index + 1}: {name} deve ser inteiro")
+    if not 1 <= number <= upper:
+        raise ValueError(f"Pergunta {index + 1}: {name} deve estar entre 1 e {upper}")
+    return number
+
+def parse_question(item, index):
+    """
+    Normaliza uma pergunta do lote: texto simples ou objeto com "picott_text" e, opcionalmente,
+    "id", "max_iterations" (1 a MAX_INITIAL_ITERATIONS) e "num_candidates" (1 a MAX_CANDIDATES).
+    Levanta ValueError se a pergunta for inválida.
+    """
+    if isinstance(item, str):
+        item = {"picott_text": item}
+    if not isinstance(item, dict) or not item.get("picott_text"):
+        raise ValueError(f"Pergunta {index + 1} sem picott_text")
+    return {
+        "id": str(item.get("id", index + 1)),
+        "picott_text": item["picott_text"],
+        "max_iterations": _bounded_int(item.get("max_iterations", 3), "max_iterations", index, MAX_INITIAL_ITERATIONS),
+        "num_candidates": _bounded_int(item.get("num_candidates", 1), "num_candidates", index, MAX_CANDIDATES),
+    }
+
+def parse_concurrency(value):
+    """
+    Converte o parâmetro `concurrency` (texto, ex.: da query string) em inteiro de 1 a
+    MAX_BATCH_CONCURRENCY; None ou vazio usa o padrão. Levanta ValueError se inválido.
+    """
+    if value is None or value == "":
+        return None
+    try:
+        concurrency = int(value)
+    except ValueError:
+        raise ValueError("concurrency deve ser inteiro")
+    if not 1 <= concurrency <= MAX_BATCH_CONCURRENCY:
+        raise ValueError(f"concurrency deve estar entre 1 e {MAX_BATCH_CONCURRENCY}")
+    return concurrency
+
+def parse_jsonl(lines):
+    """
+    Lê perguntas em JSONL (uma por linha, como string JSON ou objeto), ignorando linhas vazias.
+    """
+    questions = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            questions.append(parse_question(json.loads(line), len(questions)))
+    return questions
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as f:
+        return parse_jsonl(f)
+
+class PmidDeduplicator:
+    """
+    Mantém os PMIDs já emitidos no lote: a primeira pergunta que encontra um artigo recebe o
+    registro completo; as seguintes, apenas o PMID, a relevância e o id da pergunta de origem.
+    """
+    def __init__(self):
+        self.owners = {}
+
+    def apply(self, question_id, results):
+        deduped = []
+        for item in results:
+            owner = self.owners.setdefault(item["pmid"], question_id)
+            if owner == question_id:
+                deduped.append(item)
+            else:
+                deduped.append({"pmid": item["pmid"], "relevance": item.get("relevance"), "duplicate_of": owner})
+        return deduped
+
+async def _run_question(question, validator, searcher, refiner):
+    record = {"id": question["id"], "picott_text": question["picott_text"]}
+    try:
+        result = await run_search(
+            question["picott_text"], question["max_iterations"], question["num_candidates"],
+            validator=validator, searcher=searcher, refiner=refiner,
+        )
+    except QueryValidationError as e:
+        logger.warning(f"Pergunta {question['id']} inválida: {str(e)}")
+        return {**record, "status": INVALID, "error": str(e)}
+    except Exception as e:
+        logger.error(f"Erro na pergunta {question['id']}: {str(e)}")
+        return {**record, "status": FAILED, "error": f"Erro durante a busca: {str(e)}"}
+    return {**record, "status": DONE, **result}
+
+async def iter_batch(questions, concurrency=None, dedupe=True, validator=None, searcher=None, refiner=None):
+    """
+    Executa as perguntas com no máximo `concurrency` buscas simultâneas, compartilhando o
+    cliente PubMed, os caches e os clientes da LLM, e gera cada resultado assim que fica pronto
+    (fora da ordem de entrada; use o campo "id"). Com dedupe=True, artigos já emitidos para
+    outra pergunta do lote são substituídos por uma referência ("duplicate_of").
+    """
+    concurrency = concurrency or int(os.getenv("BATCH_CONCURRENCY", "4"))
+    semaphore = asyncio.Semaphore(concurrency)
+    validator, searcher, refiner = validator or QueryValidator(), searcher or PubmedSearcher(), refiner or SearchRefiner()
+    deduplicator = PmidDeduplicator() if dedupe else None
+    logger.info(f"Lote de {len(questions)} perguntas, {concurrency} simultâneas")
+
+    async def bounded(question):
+        async with semaphore:
+            return await _run_question(question, validator, searcher, refiner)
+
+    tasks = [asyncio.create_task(bounded(question)) for question in questions]
+    try:
+        for future in asyncio.as_completed(tasks):
+            record = await future
+            if deduplicator is not None and record["status"] == DONE:
+                record["results"] = deduplicator.apply(record["id"], record["results"])
+            yield record
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """
+    Grava os resultados em Parquet (requer pyarrow), um row group a cada `batch_size` registros.
+    A lista de artigos de cada pergunta é guardada como JSON na coluna "results".
+    """
+    def __init__(self, path, batch_size=20):
+        if pq is None:
+            raise RuntimeError("Saída em Parquet requer o pacote pyarrow")
+        self.schema = pa.schema([
+            (name, pa.int64() if name in ("total_count", "total_results", "iterations") else pa.string())
+            for name in PARQUET_COLUMNS
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.batch_size = batch_size
+        self.pending = []
+
+    def write(self, record):
+        row = {name: record.get(name) for name in PARQUET_COLUMNS}
+        row["results"] = json.dumps(record.get("results", []), ensure_ascii=False)
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_table(pa.Table.from_pylist(self.pending, schema=self.schema))
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def open_writer(path):
+    """
+    Escolhe o formato de saída pela extensão: .parquet para Parquet, qualquer outra para JSONL.
+    """
+    return ParquetWriter(path) if path.endswith(".parquet") else JsonlWriter(path)
+
+async def run_batch(questions, output_path, concurrency=None, dedupe=True, **agents):
+    """
+    Executa o lote gravando cada resultado em `output_path` assim que fica pronto.
+    Retorna a contagem de perguntas por status.
+    """
+    writer = open_writer(output_path)
+    summary = {DONE: 0, INVALID: 0, FAILED: 0}
+    try:
+        async for record in iter_batch(questions, concurrency, dedupe, **agents):
+            writer.write(record)
+            summary[record["status"]] += 1
+            logger.info(f"Pergunta {record['id']}: {record['status']} ({sum(summary.values())}/{len(questions)})")
+    finally:
+        writer.close()
+    return summary
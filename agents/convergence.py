@@ -0,0 +1,83 @@
+import math
+import logging
+from dataclasses import dataclass
+from typing import List, Set
+from agents.pubmed_searcher import MAX_USEFUL_RESULTS
+from utils.search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def query_tokens(query):
+    return set(normalize_query(query).replace("(", " ").replace(")", " ").split())
+
+@dataclass
+class Observation:
+    query: str
+    pmids: Set[str]
+    count: int
+
+class ConvergenceDetector:
+    """
+    Acompanha as iterações de refinamento e decide quando parar: quando os resultados
+    estabilizam (PMIDs, total e estrutura da query quase iguais entre iterações) ou quando o
+    orçamento de iterações, que cresce com a distância do total à faixa desejada, se esgota.
+    """
+    def __init__(self, target, max_initial_iterations, max_additional_iterations,
+                 min_pmid_overlap=0.8, max_count_change=0.1, min_query_similarity=0.8):
+        self.target = target
+        self.max_initial_iterations = max_initial_iterations
+        self.max_additional_iterations = max_additional_iterations
+        self.min_pmid_overlap = min_pmid_overlap
+        self.max_count_change = max_count_change
+        self.min_query_similarity = min_query_similarity
+        self.history: List[Observation] = []
+
+    def observe(self, query, pmids, count):
+        self.history.append(Observation(query, set(pmids), count))
+
+    def same_query(self, a, b):
+        return normalize_query(a) == normalize_query(b)
+
+    def distance(self):
+        """
+        Distância (em ordens de grandeza) entre o último total e a faixa [target, MAX_USEFUL_RESULTS].
+        """
+        if not self.history:
+            return math.log10(self.target + 1)
+        count = self.history[-1].count
+        if count < self.target:
+            return math.log10((self.target + 1) / (count + 1))
+        if count > MAX_USEFUL_RESULTS:
+            return math.log10(count / MAX_USEFUL_RESULTS)
+        return 0.0
+
+    def budget(self):
+        """
+        Número máximo de iterações: o limite inicial quando o total está na faixa desejada,
+        mais até `max_additional_iterations` proporcionais à distância.
+        """
+        extra = min(self.max_additional_iterations, math.ceil(2 * self.distance()))
+        return self.max_initial_iterations + extra
+
+    def plateaued(self):
+        """
+        Verdadeiro quando as duas últimas iterações trouxeram praticamente os mesmos PMIDs,
+        o mesmo total e queries estruturalmente equivalentes.
+        """
+        if len(self.history) < 2:
+            return False
+        previous, last = self.history[-2], self.history[-1]
+        overlap = jaccard(previous.pmids, last.pmids)
+        count_change = abs(last.count - previous.count) / max(previous.count, 1)
+        similarity = jaccard(query_tokens(previous.query), query_tokens(last.query))
+        logger.info(f"Convergência: PMIDs {overlap:.2f}, variação do total {count_change:.2f}, query {similarity:.2f}")
+        return (
+            overlap >= self.min_pmid_overlap
+            and count_change <= self.max_count_change
+            and similarity >= self.min_query_similarity
+        )
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from agents.query_validator import QueryValidationError
+from agents.search_pipeline import run_search
+from utils.abstract_cache import default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+class QueueFullError(Exception):
+    pass
+
+class JobStore:
+    """
+    Armazena o estado e o resultado dos jobs de busca em SQLite.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "jobs.sqlite3")
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if "dedupe_key" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN dedupe_key TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe_key ON jobs(dedupe_key, status)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, updated_at)")
+        self.conn.commit()
+
+    def create(self, request, dedupe_key=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, request, dedupe_key, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(request), dedupe_key, now, now),
+            )
+            self.conn.commit()
+        return job_id
+
+    def find_active(self, dedupe_key):
+        """
+        Id de um job ainda na fila ou em execução (em qualquer processo) para o mesmo pedido, ou None.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (dedupe_key, QUEUED, RUNNING),
+            ).fetchone()
+        return row["id"] if row else None
+
+    def update(self, job_id, status, result=None, error=None, only_if=None):
+        """
+        Atualiza o job; com `only_if`, apenas se o estado atual estiver entre os informados
+        (não sobrescreve, por exemplo, um cancelamento feito por outro processo).
+        Retorna True se o job foi atualizado.
+        """
+        sql = "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?"
+        params = [status, json.dumps(result) if result is not None else None, error, time.time(), job_id]
+        if only_if:
+            sql += f" AND status IN ({','.join('?' * len(only_if))})"
+            params.extend(only_if)
+        with self._lock:
+            updated = self.conn.execute(sql, params).rowcount
+            self.conn.commit()
+        return updated > 0
+
+    def heartbeat(self, job_ids):
+        """
+        Renova updated_at dos jobs ainda ativos entre `job_ids` (sinal de que o processo dono
+        está vivo) e retorna o estado atual de cada um.
+        """
+        if not job_ids:
+            return {}
+        placeholders = ",".join("?" * len(job_ids))
+        with self._lock:
+            self.conn.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE id IN ({placeholders}) AND status IN (?, ?)",
+                [time.time(), *job_ids, QUEUED, RUNNING],
+            )
+            self.conn.commit()
+            rows = self.conn.execute(f"SELECT id, status FROM jobs WHERE id IN ({placeholders})", list(job_ids)).fetchall()
+        return {row["id"]: row["status"] for row in rows}
+
+    def reconcile(self, stale_after):
+        """
+        Marca como falhos os jobs na fila ou em execução sem heartbeat há mais de `stale_after`
+        segundos: o processo que os executava foi encerrado sem concluí-los.
+        Retorna o número de jobs afetados.
+        """
+        now = time.time()
+        with self._lock:
+            reconciled = self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?) AND updated_at < ?",
+                (FAILED, "Job interrompido: o servidor foi encerrado antes da conclusão", now, QUEUED, RUNNING, now - stale_after),
+            ).rowcount
+            self.conn.commit()
+        return reconciled
+
+    def get(self, job_id):
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "request": json.loads(row["request"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def close(self):
+        self.conn.close()
+
+class JobManager:
+    """
+    Executa buscas em segundo plano com um pool fixo de workers e uma fila limitada.
+
+    Cada processo (worker do uvicorn) tem o seu JobManager, com fila e tarefas próprias, mas
+    todos compartilham o JobStore: pedidos idênticos ainda na fila ou em execução em qualquer
+    processo são unificados no mesmo job (duas submissões simultâneas em processos diferentes
+    ainda podem gerar dois jobs), e um cancelamento recebido por outro processo é gravado no
+    store e percebido pelo dono do job em até `poll_interval` segundos. Um job cancelado nunca
+    é sobrescrito pelo resultado.
+
+    O dono renova o heartbeat dos seus jobs a cada `poll_interval` segundos; jobs na fila ou em
+    execução sem heartbeat há mais de `stale_after` segundos (processo encerrado sem concluí-los)
+    são marcados como falhos na inicialização e, depois, a cada verificação. Todo acesso ao
+    store a partir do event loop passa por asyncio.to_thread.
+    """
+    def __init__(self, store=None, workers=None, max_queue=None, agents=None, poll_interval=None, stale_after=None):
+        self.store = store or JobStore()
+        self.agents = agents or {}
+        self.num_workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.poll_interval = poll_interval or float(os.getenv("JOB_POLL_SECONDS", "2"))
+        self.stale_after = stale_after or float(os.getenv("JOB_STALE_SECONDS", "30"))
+        self.queue = asyncio.Queue(maxsize=max_queue or int(os.getenv("JOB_QUEUE_SIZE", "20")))
+        self._workers = []
+        self._active = set()
+        self._tasks = {}
+        self._cancel_requested = set()
+        self._submit_lock = asyncio.Lock()
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+            self._workers.append(asyncio.create_task(self._monitor()))
+            logger.info(f"{self.num_workers} workers de jobs iniciados")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job_id in list(self._active):
+            await asyncio.to_thread(
+                self.store.update, job_id, FAILED, error="Servidor encerrado antes do início do job", only_if=(QUEUED,)
+            )
+        self._active.clear()
+
+    def _reconcile(self):
+        reconciled = self.store.reconcile(self.stale_after)
+        if reconciled:
+            logger.warning(f"{reconciled} jobs interrompidos marcados como falhos")
+
+    @staticmethod
+    def _dedupe_key(request):
+        normalized = {**request, "picott_text": " ".join(request["picott_text"].lower().split())}
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def submit(self, request):
+        """
+        Enfileira a busca e retorna (job_id, criado). Levanta QueueFullError se a fila estiver cheia.
+        As chamadas ao store rodam fora do event loop; a trava mantém a consulta de duplicatas e
+        a criação atômicas dentro do processo.
+        """
+        self.start()
+        key = self._dedupe_key(request)
+        async with self._submit_lock:
+            existing = await asyncio.to_thread(self.store.find_active, key)
+            if existing is not None:
+                logger.info(f"Job idêntico em andamento: {existing}")
+                return existing, False
+            if self.queue.full():
+                raise QueueFullError("Fila de jobs cheia; tente novamente mais tarde.")
+            job_id = await asyncio.to_thread(self.store.create, request, dedupe_key=key)
+            self._active.add(job_id)
+            self.queue.put_nowait(job_id)
+        return job_id, True
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id):
+        """
+        Marca o job como cancelado no store. Se ele roda neste processo, a tarefa é cancelada na
+        hora; em outro processo, o dono percebe o cancelamento pelo monitor.
+        """
+        if await asyncio.to_thread(self.store.update, job_id, CANCELLED, only_if=(QUEUED, RUNNING)):
+            logger.info(f"Job {job_id} cancelado")
+            self._cancel_job(job_id)
+        return await self.get(job_id)
+
+    async def _finish(self, job_id, status, result=None, error=None):
+        await asyncio.to_thread(self.store.update, job_id, status, result=result, error=error, only_if=(RUNNING,))
+        self._active.discard(job_id)
+
+    def _cancel_job(self, job_id):
+        """
+        Cancela a tarefa do job, se ela roda neste processo. O registro em _cancel_requested
+        distingue este cancelamento do encerramento do servidor (o cancelamento do worker também
+        chega à tarefa que ele aguarda).
+        """
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        self._cancel_requested.add(job_id)
+        task.cancel()
+        return True
+
+    async def _monitor(self):
+        """
+        Renova periodicamente o heartbeat dos jobs deste processo, interrompe os que foram
+        cancelados por outro processo e reconcilia os jobs de processos encerrados.
+        """
+        while True:
+            try:
+                statuses = await asyncio.to_thread(self.store.heartbeat, list(self._active))
+                await asyncio.to_thread(self._reconcile)
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao consultar jobs: {e}")
+                statuses = {}
+            for job_id, status in statuses.items():
+                if status == CANCELLED and self._cancel_job(job_id):
+                    logger.info(f"Job {job_id} cancelado por outro processo")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                job = await self.get(job_id)
+                if job is None or job["status"] != QUEUED:
+                    self._active.discard(job_id)
+                    continue
+                await self._run(job_id, job["request"])
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id, request):
+        if not await asyncio.to_thread(self.store.update, job_id, RUNNING, only_if=(QUEUED,)):
+            self._active.discard(job_id)
+            return
+        task = asyncio.create_task(run_search(
+            request["picott_text"], request.get("max_iterations", 3), request.get("num_candidates", 1), **self.agents
+        ))
+        self._tasks[job_id] = task
+        try:
+            result = await task
+            await self._finish(job_id, DONE, result=result)
+        except asyncio.CancelledError:
+            if job_id not in self._cancel_requested:
+                task.cancel()
+                await self._finish(job_id, CANCELLED, error="Servidor encerrado")
+                raise
+            await self._finish(job_id, CANCELLED)
+        except QueryValidationError as e:
+            await self._finish(job_id, FAILED, error=str(e))
+        except Exception as e:
+            logger.error(f"Erro no job {job_id}: {str(e)}")
+            await self._finish(job_id, FAILED, error=f"Erro durante a busca: {str(e)}")
+        finally:
+            self._tasks.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
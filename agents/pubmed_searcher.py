@@ -1,25 +1,117 @@
-from utils.pubmed_api import PubmedAPI
+from utils.pubmed_api import EfetchError, get_pubmed_api
+from utils.query_parser import QuerySyntaxError, subclauses
+from utils.term_stats import TermStats
 import logging
 
 logger = logging.getLogger(__name__)
 
+MAX_USEFUL_RESULTS = 500
+
 class PubmedSearcher:
-    def __init__(self):
-        self.api = PubmedAPI()
+    def __init__(self, api=None):
+        self.api = api or get_pubmed_api()
 
     def build_initial_query(self, validated_query):
+        """
+        Heurística de reserva, usada apenas quando a validação não retorna uma query inicial válida.
+        """
         terms = validated_query.split()
         key_terms = [term for term in terms if len(term) > 3 and term not in ["for", "in", "with", "and"]]
         query = " ".join(key_terms[:3])
         logger.info(f"Query inicial construída: {query}")
         return query
 
-    def search_pubmed(self, query):
-        pmids = self.api.esearch(query)
-        if not pmids:
+    async def search_pubmed(self, query):
+        """
+        Retorna (artigos, total de resultados no PubMed) para a query.
+        """
+        result = await self.api.esearch(query)
+        if not result.pmids:
+            logger.warning(f"Nenhum PMID encontrado para a query: {query}")
+            return [], result.count
+        articles = await self.api.efetch_articles(result.pmids)
+        if not articles:
+            logger.warning(f"Nenhum abstract retornado para PMIDs: {result.pmids}")
+        return articles, result.count
+
+    async def search_incremental(self, query, working_set, iteration):
+        """
+        Como search_pubmed, mas dentro de uma sessão: só busca no efetch os PMIDs que o
+        conjunto de trabalho ainda não tem. Retorna (artigos, total, Delta da iteração).
+        """
+        result = await self.api.esearch(query)
+        if not result.pmids:
             logger.warning(f"Nenhum PMID encontrado para a query: {query}")
+        missing = working_set.missing(result.pmids)
+        if missing:
+            articles, complete = [], True
+            try:
+                async for article in self.api.iter_articles(missing, raise_errors=True):
+                    articles.append(article)
+            except EfetchError:
+                logger.warning(f"efetch incompleto: {len(missing) - len(articles)} PMIDs serão buscados de novo")
+                complete = False
+            working_set.add(missing, articles, complete)
+        delta = working_set.update(iteration, result.pmids)
+        logger.info(
+            f"Conjunto de trabalho: {len(missing)} PMIDs baixados, {len(delta.added)} entraram, "
+            f"{len(delta.dropped)} saíram"
+        )
+        return working_set.resolve(result.pmids), result.count, delta
+
+    def rank_articles(self, articles, validated_query):
+        """
+        Reordena os artigos pela relevância BM25 (título + abstract) à query validada.
+        Retorna (artigos, pontuações) na nova ordem.
+        """
+        if not articles:
             return [], []
-        abstracts = self.api.efetch_abstracts(pmids)
-        if not abstracts:
-            logger.warning(f"Nenhum abstract retornado para PMIDs: {pmids}")
-        return abstracts, pmids
\ No newline at end of file
+        relevance = TermStats(article.to_text() for article in articles).relevance(validated_query)
+        order = sorted(range(len(articles)), key=lambda i: -relevance[i])
+        return [articles[i] for i in order], [float(relevance[i]) for i in order]
+
+    def score_candidate(self, query, count, validated_query, target):
+        """
+        Pontua uma query candidata pelo número de resultados (ideal entre `target` e
+        MAX_USEFUL_RESULTS) e pela cobertura dos termos da query validada.
+        """
+        if count == 0:
+            return 0.0
+        if count < target:
+            count_score = count / target
+        elif count > MAX_USEFUL_RESULTS:
+            count_score = MAX_USEFUL_RESULTS / count
+        else:
+            count_score = 1.0
+        key_terms = {term.lower() for term in validated_query.split() if len(term) > 3}
+        covered = sum(1 for term in key_terms if term in query.lower())
+        relevance = covered / len(key_terms) if key_terms else 0.0
+        return count_score + 0.5 * relevance
+
+    async def pick_best_query(self, candidates, validated_query, target):
+        """
+        Conta os resultados de todas as candidatas (rettype=count) e retorna a de maior pontuação;
+        PMIDs e abstracts são buscados depois, apenas para a query escolhida.
+        """
+        counts = await self.api.count_many(candidates)
+        scored = [
+            (self.score_candidate(query, count, validated_query, target), query, count)
+            for query, count in zip(candidates, counts)
+        ]
+        for score, query, count in scored:
+            logger.info(f"Candidata ({count} resultados, score {score:.2f}): {query}")
+        return max(scored, key=lambda item: item[0])[1]
+
+    async def probe_clauses(self, query):
+        """
+        Retorna [(sub-expressão, total)] para cada operando de primeiro nível da query,
+        para que o refinador veja qual parte restringe ou amplia demais a busca.
+        """
+        try:
+            clauses = subclauses(query)
+        except QuerySyntaxError:
+            return []
+        if not clauses:
+            return []
+        counts = await self.api.count_many(clauses)
+        return list(zip(clauses, counts))
@@ -1,70 +1,121 @@
-from anthropic import Anthropic, APIError
+import json
 import logging
-import os
-from dotenv import load_dotenv
-from typing import Tuple, Optional
-
-load_dotenv()
+from dataclasses import dataclass, field
+from typing import Dict, Tuple, Optional
+from pydantic import BaseModel, StrictBool, StrictStr
+from utils.llm_cache import create_message, get_llm_cache
+from utils.llm_interface import get_llm_router
+from utils.query_parser import QuerySyntaxError, clean_query
 
 logger = logging.getLogger(__name__)
 
 class QueryValidationError(Exception):
     pass
 
+# Resposta curta (JSON com tradução, elementos PICO e query inicial); não precisa do limite do refinamento
+MAX_VALIDATION_TOKENS = 800
+PICO_ELEMENTS = ("population", "intervention", "comparison", "outcome")
+
+@dataclass
+class QueryAnalysis:
+    """
+    Resultado da etapa de validação: tradução em inglês, elementos PICO e query inicial
+    para o PubMed (None se a LLM não gerou uma query válida).
+    """
+    translation: str
+    pico: Dict[str, str] = field(default_factory=dict)
+    initial_query: Optional[str] = None
+
+class ValidationReply(BaseModel):
+    """
+    Formato esperado da resposta JSON da validação. Tipos estritos: um campo com tipo errado
+    (ex.: lista em vez de texto, "false" como string) torna a resposta malformada.
+    """
+    valid: StrictBool = False
+    translation: Optional[StrictStr] = None
+    population: Optional[StrictStr] = None
+    intervention: Optional[StrictStr] = None
+    comparison: Optional[StrictStr] = None
+    outcome: Optional[StrictStr] = None
+    initial_query: Optional[StrictStr] = None
+
+def _parse_json(response):
+    """
+    Extrai o objeto JSON da resposta e o valida como ValidationReply. Levanta ValueError
+    (pydantic.ValidationError é um ValueError) se a resposta estiver malformada.
+    """
+    start, end = response.find("{"), response.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("resposta sem objeto JSON")
+    return ValidationReply.model_validate(json.loads(response[start:end + 1]))
+
 class QueryValidator:
-    def __init__(self):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY não definida no .env")
-        self.client = Anthropic(api_key=api_key)
-        self.model = "claude-3-7-sonnet-20250219"
+    def __init__(self, router=None):
+        self.router = router or get_llm_router()
+        self.cache = get_llm_cache()
 
-    def validate_query(self, user_query: str) -> Tuple[bool, Optional[str]]:
+    async def analyze_query(self, user_query: str) -> Optional[QueryAnalysis]:
         """
-        Valida a query usando a API Anthropic e retorna se é válida e a tradução em inglês.
-        Retorna (is_valid, translated_query).
+        Em uma única chamada à LLM: valida a query, traduz para o inglês, extrai os elementos
+        PICO e gera a query inicial do PubMed. Retorna None se a query for inválida; se nenhum
+        modelo responder, LLMUnavailableError é propagada (falha do serviço, não da query).
         """
         if len(user_query) < 10 or not any(c.isalpha() for c in user_query):
             logger.error("Query inválida: muito curta ou sem letras.")
-            return False, None
-        
+            return None
+
         prompt = f"""
         Analise a seguinte query: "{user_query}"
         Verifique se ela contém pelo menos um dos seguintes:
         1. Uma população específica (ex.: "pacientes com diabetes", "high-grade glioma")
         2. Uma intervenção (ex.: "tratamento com insulina", "ENT", "TTFields")
-        Responda no formato:
-        "Sim\nTradução: <query em inglês com termos genéricos>"
-        ou "Não" se inválida.
+        Se for válida, traduza para o inglês com termos genéricos, extraia os elementos PICO
+        (em inglês; string vazia se ausente) e monte a query inicial para o PubMed:
+        - Combine população e intervenção com AND; sinônimos e siglas óbvios com OR dentro do mesmo parêntese.
+        - Termos entre aspas ou com wildcard (ex.: "migrain*"), sem tags de campo ([tiab], [mh]), filtros ou anos.
+        - Não inclua outcomes nem comparadores nesta primeira query.
+        Responda APENAS com um objeto JSON, sem texto adicional, no formato:
+        {{"valid": true, "translation": "<query em inglês>", "population": "...", "intervention": "...", "comparison": "...", "outcome": "...", "initial_query": "<query do PubMed>"}}
+        ou {{"valid": false}} se inválida.
         """
         try:
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=4000,
-                temperature=0.8,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            response = await create_message(
+                self.router, "validation", prompt, max_tokens=MAX_VALIDATION_TOKENS, cache=self.cache
             )
-            response = message.content[0].text.strip()
             logger.debug(f"Resposta da LLM para validação: {response}")
-            if "Sim" in response:
-                translated_query = response.split("\nTradução: ")[1].strip()
-                return True, translated_query
-            return False, None
-        except APIError as e:
-            logger.error(f"Erro na API Anthropic: {e}")
-            return False, None
-        except IndexError:
-            logger.error("Erro ao parsear tradução da LLM.")
-            return False, None
+            reply = _parse_json(response)
+        except ValueError as e:
+            logger.error(f"Erro ao parsear resposta da validação: {e}")
+            return None
+        if reply.valid is not True or not (reply.translation or "").strip():
+            return None
+
+        initial_query = None
+        if reply.initial_query:
+            try:
+                initial_query = clean_query(reply.initial_query)
+            except QuerySyntaxError as e:
+                logger.warning(f"Query inicial da LLM inválida ({e}): {reply.initial_query}")
+        return QueryAnalysis(
+            translation=reply.translation.strip(),
+            pico={element: (getattr(reply, element) or "").strip() for element in PICO_ELEMENTS},
+            initial_query=initial_query,
+        )
+
+    async def validate_query(self, user_query: str) -> Tuple[bool, Optional[str]]:
+        """
+        Valida a query e retorna (is_valid, translated_query).
+        """
+        analysis = await self.analyze_query(user_query)
+        return (True, analysis.translation) if analysis else (False, None)
 
-def validate_and_raise(query: str) -> str:
+async def validate_and_raise(query: str, validator: Optional[QueryValidator] = None) -> QueryAnalysis:
     """
-    Valida a query e levanta exceção se inválida, retornando a tradução se válida.
+    Valida a query e levanta QueryValidationError se inválida (ou LLMUnavailableError se a LLM
+    estiver indisponível), retornando a análise (tradução, PICO e query inicial) se válida.
     """
-    validator = QueryValidator()
-    is_valid, translated_query = validator.validate_query(query)
-    if not is_valid:
+    validator = validator or QueryValidator()
+    analysis = await validator.analyze_query(query)
+    if analysis is None:
         raise QueryValidationError("Query inválida: deve conter uma população específica ou uma intervenção.")
-    return translated_query
\ No newline at end of file
+    return analysis
@@ -0,0 +1,149 @@
+import logging
+from typing import AsyncIterator, Optional
+from agents.convergence import ConvergenceDetector
+from agents.query_validator import QueryValidator, validate_and_raise
+from agents.pubmed_searcher import MAX_USEFUL_RESULTS, PubmedSearcher
+from agents.search_refiner import SearchRefiner
+from agents.working_set import WorkingSet
+from utils.metrics import ITERATIONS, stage
+
+logger = logging.getLogger(__name__)
+
+MAX_ADDITIONAL_ITERATIONS = 5
+# Limites aceitos dos parâmetros de uma busca (API, jobs e lote)
+MAX_INITIAL_ITERATIONS = 10
+MAX_CANDIDATES = 5
+MIN_ABSTRACTS = 20  # Número mínimo de abstracts desejado
+
+def _results_event(iteration, query, articles, total_count, delta, working_set):
+    return {
+        "event": "results",
+        "iteration": iteration,
+        "query": query,
+        "total_count": total_count,
+        "pmids": [article.pmid for article in articles],
+        "new_articles": [article.to_dict() for article in working_set.resolve(delta.first_seen)],
+        "dropped_pmids": delta.dropped,
+    }
+
+def _delta_abstracts(delta, working_set):
+    return [article.to_text() for article in working_set.resolve(delta.added)]
+
+async def iter_search(
+    user_query: str,
+    max_initial_iterations: int = 3,
+    num_candidates: int = 1,
+    validator: Optional[QueryValidator] = None,
+    searcher: Optional[PubmedSearcher] = None,
+    refiner: Optional[SearchRefiner] = None,
+) -> AsyncIterator[dict]:
+    """
+    Executa o fluxo completo (validação, busca inicial e refinamentos) de forma assíncrona,
+    gerando um evento por etapa; o último evento ("done") traz o resultado final.
+    Com num_candidates > 1, cada iteração avalia várias queries refinadas em paralelo e segue com a melhor.
+    Fechar o gerador interrompe a busca. Levanta QueryValidationError se a query for inválida.
+    """
+    # Span da requisição: pai explícito das etapas de validação e de cada iteração
+    with stage("search", num_candidates=num_candidates) as root:
+        with stage("validation", parent=root):
+            analysis = await validate_and_raise(user_query, validator)
+        validated_query = analysis.translation
+        logger.info(f"Query validada e traduzida: {validated_query}")
+        working_set = WorkingSet()
+
+        searcher = searcher or PubmedSearcher()
+        refiner = refiner or SearchRefiner()
+
+        # Query inicial gerada pela LLM na validação; a heurística só é usada se ela faltar ou for inválida
+        initial_query = analysis.initial_query or searcher.build_initial_query(validated_query)
+        yield {"event": "validated", "validated_query": validated_query, "pico": analysis.pico, "initial_query": initial_query}
+        articles, total_count, delta = await searcher.search_incremental(initial_query, working_set, 0)
+        articles, scores = searcher.rank_articles(articles, validated_query)
+        pmids = [article.pmid for article in articles]
+
+        yield _results_event(0, initial_query, articles, total_count, delta, working_set)
+
+        if not pmids:
+            logger.warning("Nenhum resultado na busca inicial.")
+
+        detector = ConvergenceDetector(MIN_ABSTRACTS, max_initial_iterations, MAX_ADDITIONAL_ITERATIONS)
+        detector.observe(initial_query, pmids, total_count)
+        current_query = initial_query
+        iteration = 0
+
+        while True:
+            iteration += 1
+            with stage("iteration", parent=root, iteration=iteration):
+                logger.info(f"Iteração {iteration} - Query atual: {current_query}")
+                # Contagem por parte da query (uma requisição por cláusula) só quando o total está
+                # fora da faixa útil, em que o refinador precisa saber qual parte restringe ou amplia demais
+                clause_counts = None
+                if not MIN_ABSTRACTS <= total_count <= MAX_USEFUL_RESULTS:
+                    clause_counts = await searcher.probe_clauses(current_query)
+                # O refinador recebe apenas os artigos que entraram desde a iteração anterior
+                abstracts = _delta_abstracts(delta, working_set)
+                if num_candidates > 1:
+                    candidates = await refiner.refine_candidates(
+                        current_query, abstracts, validated_query, total_count, num_candidates,
+                        clause_counts=clause_counts, delta=delta,
+                    )
+                    refined_query = await searcher.pick_best_query(candidates, validated_query, MIN_ABSTRACTS)
+                else:
+                    refined_query = await refiner.refine_search(
+                        current_query, abstracts, validated_query, total_count, clause_counts=clause_counts, delta=delta
+                    )
+                logger.info(f"Query refinada: {refined_query}")
+                yield {"event": "refined", "iteration": iteration, "query": refined_query}
+
+                # Verificar se a query não mudou (após normalização) e há resultados suficientes
+                if detector.same_query(refined_query, current_query) and len(articles) >= MIN_ABSTRACTS:
+                    logger.info("Busca finalizada com resultados suficientes.")
+                    stop_reason = "unchanged"
+                    break
+
+                # Verificar o orçamento de iterações, ajustado pela distância do total à faixa desejada
+                if iteration > detector.budget():
+                    logger.warning(f"Orçamento de iterações atingido ({detector.budget()}) com {len(articles)} abstracts.")
+                    stop_reason = "budget"
+                    break
+
+                current_query = refined_query
+                articles, total_count, delta = await searcher.search_incremental(current_query, working_set, iteration)
+                articles, scores = searcher.rank_articles(articles, validated_query)
+                pmids = [article.pmid for article in articles]
+                detector.observe(current_query, pmids, total_count)
+                logger.info(f"Novos resultados - PMIDs: {len(pmids)} de {total_count}, {len(delta.added)} novos")
+                yield _results_event(iteration, current_query, articles, total_count, delta, working_set)
+
+                # Parar quando os resultados estabilizarem entre iterações
+                if pmids and detector.plateaued():
+                    logger.info("Resultados estabilizados entre iterações; busca finalizada.")
+                    stop_reason = "plateau"
+                    break
+
+        ITERATIONS.observe(iteration)
+        results = [
+            {**article.to_dict(), "relevance": score, "introduced": working_set.provenance[article.pmid].introduced}
+            for article, score in zip(articles, scores)
+        ]
+        yield {
+            "event": "done",
+            "query": refined_query,
+            "results": results,
+            "total_results": len(results),
+            "total_count": total_count,
+            "iterations": iteration,
+            "stop_reason": stop_reason,
+            "exhausted": stop_reason == "budget" and len(articles) < MIN_ABSTRACTS,
+            "dropped": working_set.dropped_articles(),
+        }
+
+async def run_search(user_query: str, *args, **kwargs) -> dict:
+    """
+    Executa iter_search até o fim e retorna o resultado final (evento "done", sem a chave "event").
+    """
+    result = None
+    async for event in iter_search(user_query, *args, **kwargs):
+        result = event
+    result.pop("event")
+    return result
@@ -1,38 +1,68 @@
-from anthropic import Anthropic
+import asyncio
 import logging
-import re
-import random
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from utils.llm_cache import create_message, get_llm_cache
+from utils.llm_interface import get_llm_router
+from utils.query_parser import QuerySyntaxError, clean_query
+from utils.term_stats import TermStats, tokenize
 
 logger = logging.getLogger(__name__)
 
+MAX_REPROMPTS = 2
+
+# Orientação acrescentada ao prompt de cada candidata (variant) em refine_candidates, para que
+# as candidatas difiram mesmo com temperatura 0 (LLM_DETERMINISTIC=1). A candidata 0 usa o prompt base.
+VARIANT_STRATEGIES = [
+    None,
+    "Priorize a sensibilidade: amplie a query com sinônimos, siglas e wildcards relevantes.",
+    "Priorize a especificidade: mantenha apenas os termos centrais da população e da intervenção.",
+    "Use as contagens por parte da query para substituir os termos que restringem ou ampliam demais.",
+    "Priorize nomes comerciais de medicações, dispositivos e siglas encontrados nos abstracts.",
+]
+
 class SearchRefiner:
-    def __init__(self):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        self.model = "claude-3-7-sonnet-20250219"
+    def __init__(self, router=None):
+        self.router = router or get_llm_router()
+        self.cache = get_llm_cache()
 
-    def extract_terms_from_abstracts(self, abstracts):
+    def extract_terms_from_abstracts(self, abstracts, current_query="", top_n=10, stats=None):
+        """
+        Termos mais informativos dos abstracts (peso BM25), excluindo os já presentes na query
+        atual, e siglas com a forma longa quando definida no texto. Resultado determinístico.
+        """
         if not abstracts:
-            return set()
-        num_abstracts = min(random.randint(1, 5), len(abstracts))
-        selected_abstracts = random.sample(abstracts, num_abstracts)
-        terms = set()
-        for abstract in selected_abstracts:
-            siglas = re.findall(r'\b[A-Z]{2,}\b', abstract)
-            terms.update(siglas)
-            words = re.findall(r'\b\w{4,}\b', abstract.lower())
-            frequent_terms = [word for word in set(words) if words.count(word) > 1 and word not in ["with", "from", "this", "study", "patients"]]
-            terms.update(frequent_terms[:2])
+            return []
+        stats = stats or TermStats(abstracts)
+        acronyms = stats.acronyms(top_n)
+        terms = [f"{acronym} ({long_form})" if long_form else acronym for acronym, long_form in acronyms]
+        exclude = tokenize(current_query) + [acronym for acronym, _ in acronyms]
+        terms += stats.salient_terms(top_n, exclude=exclude)
         return terms
 
-    def refine_search(self, current_query, abstracts, original_query):
+    async def refine_search(self, current_query, abstracts, original_query, total_count=None, variant=0,
+                            clause_counts=None, delta=None):
+        """
+        Gera a query refinada. Com `delta` (Delta da iteração), `abstracts` contém apenas os artigos
+        que entraram no resultado desde a iteração anterior, e o prompt informa quantos saíram.
+        """
+        stats = TermStats(abstracts) if abstracts else None
+        if stats:
+            sample = [abstracts[i] for i in stats.rank(original_query)[:3]]
+        elif delta is not None and delta.iteration > 0:
+            sample = "Nenhum artigo novo em relação à iteração anterior"
+        else:
+            sample = "Nenhum resultado encontrado"
+        if delta is not None and delta.iteration > 0:
+            returned = (
+                f"Mudança em relação à iteração anterior: {len(delta.added)} artigos entraram e {len(delta.dropped)} saíram.\n"
+                f"        Abstracts que entraram (amostra dos mais relevantes): {sample}"
+            )
+        else:
+            returned = f"Abstracts retornados (amostra dos mais relevantes): {sample}"
         prompt = f"""
         Query original do usuário: "{original_query}"
         Query atual no PubMed: "{current_query}"
-        Abstracts retornados (amostra): {abstracts[:3] if abstracts else 'Nenhum resultado encontrado'}
+        Total de resultados no PubMed para a query atual: {total_count if total_count is not None else 'desconhecido'}
+        {returned}
         Refine a query para ser usada diretamente no PubMed:
         - Considere a população e a intervenção da query original como base.
         - Use os abstracts para identificar siglas (ex.: "SAH" para "subarachnoid hemorrhage") ou sinônimos relevantes, adicionando-os com "OR" apenas se não forem redundantes.
@@ -59,17 +89,45 @@ class SearchRefiner:
         - Garantir o máximo de sinônimos relevantes! 
         """
         if abstracts:
-            extra_terms = self.extract_terms_from_abstracts(abstracts)
+            extra_terms = self.extract_terms_from_abstracts(abstracts, current_query, stats=stats)
             prompt += f"\nTermos extraídos dos abstracts (priorize especificidade, inclua dispositivos e medicações): {', '.join(extra_terms)}"
+        if clause_counts:
+            counts = "; ".join(f"{clause}: {count}" for clause, count in clause_counts)
+            prompt += f"\nTotal de resultados de cada parte da query atual (use para ver qual parte restringe ou amplia demais): {counts}"
+        strategy = VARIANT_STRATEGIES[variant % len(VARIANT_STRATEGIES)]
+        if strategy:
+            prompt += f"\nEstratégia desta versão da query: {strategy}"
         
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=4000,
-            temperature=0.8,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        refined_query = message.content[0].text.strip()
-        logger.debug(f"Query refinada gerada: {refined_query}")
-        return refined_query
\ No newline at end of file
+        attempt_prompt = prompt
+        for attempt in range(MAX_REPROMPTS + 1):
+            response = await create_message(self.router, "refinement", attempt_prompt, variant=variant, cache=self.cache)
+            response = response.strip("`").strip()
+            try:
+                refined_query = clean_query(response)
+            except QuerySyntaxError as e:
+                logger.warning(f"Query refinada inválida ({e}), tentativa {attempt + 1}: {response}")
+                attempt_prompt = prompt + f"""
+        A resposta anterior "{response}" não é uma query válida para o PubMed ({e}).
+        Corrija a sintaxe (aspas, parênteses e operadores AND/OR/NOT) e retorne APENAS a query corrigida.
+        """
+                continue
+            logger.debug(f"Query refinada gerada: {refined_query}")
+            return refined_query
+        logger.error("Nenhuma query refinada válida gerada; mantendo a query atual.")
+        return current_query
+
+    async def refine_candidates(self, current_query, abstracts, original_query, total_count=None, num_candidates=3,
+                                clause_counts=None, delta=None):
+        """
+        Gera até `num_candidates` queries refinadas em chamadas paralelas à LLM, sem duplicatas;
+        cada candidata recebe uma estratégia diferente (VARIANT_STRATEGIES) no prompt.
+        """
+        candidates = await asyncio.gather(*(
+            self.refine_search(
+                current_query, abstracts, original_query, total_count, variant=i, clause_counts=clause_counts, delta=delta
+            )
+            for i in range(num_candidates)
+        ))
+        unique = list(dict.fromkeys(candidates))
+        logger.info(f"{len(unique)} candidatas distintas de {num_candidates} geradas")
+        return unique
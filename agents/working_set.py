@@ -0,0 +1,83 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+@dataclass
+class Provenance:
+    introduced: int
+    dropped: Optional[int] = None
+
+@dataclass
+class Delta:
+    """
+    Diferença entre os PMIDs de duas iterações consecutivas da mesma sessão.
+    `added` inclui artigos que voltaram após terem sido removidos; `first_seen` só os inéditos.
+    """
+    iteration: int
+    added: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+    first_seen: List[str] = field(default_factory=list)
+
+class WorkingSet:
+    """
+    Conjunto de trabalho de uma sessão de busca: guarda os artigos já baixados, de modo que
+    cada iteração só busque no efetch os PMIDs inéditos, e registra em que iteração cada
+    artigo entrou e, se for o caso, saiu do resultado.
+    """
+    def __init__(self):
+        self.articles = {}
+        self.unavailable = set()
+        self.provenance: Dict[str, Provenance] = {}
+        self.current: List[str] = []
+
+    def missing(self, pmids):
+        """
+        PMIDs ainda não baixados nesta sessão (nem sabidamente indisponíveis no efetch).
+        """
+        return [pmid for pmid in pmids if pmid not in self.articles and pmid not in self.unavailable]
+
+    def add(self, requested, articles, complete=True):
+        """
+        Guarda os artigos baixados. Só com complete=True (efetch concluído sem erro) os PMIDs
+        pedidos e não retornados são marcados como indisponíveis; após uma falha, eles voltam
+        a ser buscados na próxima iteração.
+        """
+        for article in articles:
+            self.articles[article.pmid] = article
+        if complete:
+            self.unavailable.update(pmid for pmid in requested if pmid not in self.articles)
+
+    def update(self, iteration, pmids):
+        """
+        Torna `pmids` o resultado atual, atualiza a proveniência e retorna o Delta em relação à iteração anterior.
+        """
+        pmids = [pmid for pmid in pmids if pmid in self.articles]
+        previous, now = set(self.current), set(pmids)
+        delta = Delta(iteration)
+        for pmid in pmids:
+            if pmid in previous:
+                continue
+            delta.added.append(pmid)
+            if pmid in self.provenance:
+                self.provenance[pmid].dropped = None
+            else:
+                self.provenance[pmid] = Provenance(iteration)
+                delta.first_seen.append(pmid)
+        for pmid in self.current:
+            if pmid not in now:
+                delta.dropped.append(pmid)
+                self.provenance[pmid].dropped = iteration
+        self.current = pmids
+        return delta
+
+    def resolve(self, pmids):
+        return [self.articles[pmid] for pmid in pmids if pmid in self.articles]
+
+    def dropped_articles(self):
+        """
+        Artigos vistos em alguma iteração e ausentes do resultado atual, com a proveniência.
+        """
+        return [
+            {"pmid": pmid, "title": self.articles[pmid].title, "introduced": info.introduced, "dropped": info.dropped}
+            for pmid, info in self.provenance.items()
+            if info.dropped is not None
+        ]
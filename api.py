@@ -1,21 +1,27 @@
 # C:\Users\Usuario\Desktop\projetos\PUBMED_CREW\api.py
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
+import json
 import logging
+import xml.etree.ElementTree as ET
+import httpx
 from dotenv import load_dotenv
 import os
-from agents.pubmed_searcher import PubmedSearcher
-from agents.search_refiner import SearchRefiner
-from agents.query_validator import validate_and_raise, QueryValidationError
+from agents.app_context import AppContext
+from agents.batch_search import MAX_BATCH_CONCURRENCY, iter_batch, parse_concurrency, parse_jsonl, parse_question
+from agents.job_manager import JobManager, QueueFullError
+from agents.query_validator import QueryValidationError
+from agents.search_pipeline import MAX_CANDIDATES, MAX_INITIAL_ITERATIONS, iter_search, run_search
+from utils.llm_interface import LLMUnavailableError
+from utils.pubmed_api import MAX_HARVEST_RECORDS
+from utils.query_parser import QuerySyntaxError
 
 load_dotenv()
 
-# Verificar variáveis de ambiente
-required_vars = ["ANTHROPIC_API_KEY", "PUBMED_EMAIL"]
-for var in required_vars:
-    if not os.getenv(var):
-        raise ValueError(f"Variável de ambiente {var} não definida no .env")
-
 # Configurar logging
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
@@ -23,75 +29,209 @@ logger = logging.getLogger(__name__)
 # Definir o modelo de entrada usando Pydantic
 class SearchRequest(BaseModel):
     picott_text: str
-    max_iterations: int = 3
+    max_iterations: int = Field(3, ge=1, le=MAX_INITIAL_ITERATIONS)
+    num_candidates: int = Field(1, ge=1, le=MAX_CANDIDATES)
+
+class HarvestRequest(BaseModel):
+    query: str
+    max_records: int = Field(MAX_HARVEST_RECORDS, ge=1, le=MAX_HARVEST_RECORDS)
+    batch_size: int = Field(200, ge=1, le=10000)
+
+class BatchRequest(BaseModel):
+    questions: List[Union[str, dict]]
+    concurrency: Optional[int] = Field(None, ge=1, le=MAX_BATCH_CONCURRENCY)
+    dedupe: bool = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Constrói clientes, caches e agentes uma vez por processo (cada worker do uvicorn tem o seu)
+    e os fecha no encerramento. Falta de configuração impede a inicialização do worker.
+    Com vários workers, defina WEB_CONCURRENCY (lido também pelo uvicorn como --workers) para
+    que o limite de requisições ao NCBI seja dividido entre eles.
+    """
+    context = AppContext.create()
+    jobs = JobManager(agents=context.agents())
+    jobs.start()
+    app.state.context = context
+    app.state.jobs = jobs
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        await jobs.stop()
+        await context.aclose()
 
 # Inicializar o FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+def get_context(request: Request) -> AppContext:
+    return request.app.state.context
+
+def get_jobs(request: Request) -> JobManager:
+    return request.app.state.jobs
+
+@app.get("/ready")
+async def ready(http_request: Request):
+    """
+    Prontidão do worker: 200 quando o contexto foi inicializado e os componentes locais
+    respondem; 503 durante a inicialização, o encerramento ou se algum componente falhar.
+    """
+    if not getattr(http_request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"ready": False, "checks": {}})
+    checks = http_request.app.state.context.readiness()
+    ok = all(checks.values())
+    return JSONResponse(status_code=200 if ok else 503, content={"ready": ok, "checks": checks})
 
 @app.post("/api/search")
-async def search_pubmed(request: SearchRequest):
+async def search_pubmed(request: SearchRequest, context: AppContext = Depends(get_context)):
     user_query = request.picott_text
     max_initial_iterations = request.max_iterations
     logger.info(f"Query recebida: {user_query}, Max iterações: {max_initial_iterations}")
 
     try:
-        # Validar e traduzir a query usando a nova função
-        validated_query = validate_and_raise(user_query)
-        logger.info(f"Query validada e traduzida: {validated_query}")
-
-        searcher = PubmedSearcher()
-        refiner = SearchRefiner()
-
-        initial_query = searcher.build_initial_query(validated_query)
-        abstracts, pmids = searcher.search_pubmed(initial_query)
-
-        if not pmids:
-            logger.warning("Nenhum resultado na busca inicial.")
-
-        current_query = initial_query
-        iteration = 0
-        max_additional_iterations = 5
-        min_abstracts = 20
-
-        while True:
-            iteration += 1
-            logger.info(f"Iteração {iteration} - Query atual: {current_query}")
-            refined_query = refiner.refine_search(current_query, abstracts, validated_query)
-            logger.info(f"Query refinada: {refined_query}")
-
-            if refined_query == current_query and pmids and len(abstracts) >= min_abstracts:
-                logger.info("Busca finalizada com resultados suficientes.")
-                break
-
-            if iteration > max_initial_iterations:
-                if len(abstracts) >= min_abstracts:
-                    logger.info(f"Limite inicial de iterações atingido, mas número de abstracts suficiente ({len(abstracts)}).")
-                    break
-                else:
-                    logger.warning(f"Limite inicial de iterações atingido, mas número de abstracts insuficiente ({len(abstracts)}). Tentando mais {max_additional_iterations} iterações.")
-
-            if iteration > (max_initial_iterations + max_additional_iterations):
-                logger.warning("Limite total de iterações atingido.")
-                break
-
-            current_query = refined_query
-            abstracts, pmids = searcher.search_pubmed(current_query)
-            logger.info(f"Novos resultados - PMIDs: {pmids}, Abstracts: {len(abstracts)} encontrados")
-
-            if not pmids and iteration == 1:
-                logger.info("Primeira iteração sem resultados; permitindo mais refinamentos.")
-
-        # Preparar a resposta
-        results = [{"pmid": pmid, "abstract": abstract} for pmid, abstract in zip(pmids, abstracts)]
+        result = await run_search(user_query, max_initial_iterations, request.num_candidates, **context.agents())
         return {
-            "query": refined_query,
-            "results": results,
-            "total_results": len(results)
+            "query": result["query"],
+            "results": result["results"],
+            "total_results": result["total_results"],
+            "total_count": result["total_count"],
+            "iterations": result["iterations"]
         }
 
     except QueryValidationError as e:
         logger.error(f"Query inválida: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
+    except LLMUnavailableError as e:
+        logger.error(f"LLM indisponível: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         logger.error(f"Erro durante a busca: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erro durante a busca: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro durante a busca: {str(e)}")
+
+def _sse(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+@app.post("/api/search/stream")
+async def search_pubmed_stream(request: SearchRequest, http_request: Request, context: AppContext = Depends(get_context)):
+    """
+    Variante em Server-Sent Events de /api/search: emite um evento por etapa (validação,
+    query refinada, novos artigos) e interrompe a busca se o cliente desconectar.
+    """
+    logger.info(f"Query recebida (stream): {request.picott_text}, Max iterações: {request.max_iterations}")
+
+    async def events():
+        search = iter_search(request.picott_text, request.max_iterations, request.num_candidates, **context.agents())
+        try:
+            async for event in search:
+                if await http_request.is_disconnected():
+                    logger.info("Cliente desconectou; busca interrompida.")
+                    break
+                yield _sse(event)
+        except QueryValidationError as e:
+            logger.error(f"Query inválida: {str(e)}")
+            yield _sse({"event": "error", "status_code": 400, "detail": str(e)})
+        except LLMUnavailableError as e:
+            logger.error(f"LLM indisponível: {str(e)}")
+            yield _sse({"event": "error", "status_code": 503, "detail": str(e)})
+        except Exception as e:
+            logger.error(f"Erro durante a busca: {str(e)}")
+            yield _sse({"event": "error", "status_code": 500, "detail": f"Erro durante a busca: {str(e)}"})
+        finally:
+            await search.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/api/search/batch")
+async def search_pubmed_batch(http_request: Request, context: AppContext = Depends(get_context)):
+    """
+    Executa um lote de perguntas, recebidas como JSON ({"questions": [...]}) ou como JSONL
+    (Content-Type application/x-ndjson), e responde em NDJSON, uma linha por pergunta concluída.
+    """
+    body = await http_request.body()
+    try:
+        if "ndjson" in http_request.headers.get("content-type", ""):
+            questions = parse_jsonl(body.decode("utf-8").splitlines())
+            concurrency = parse_concurrency(http_request.query_params.get("concurrency"))
+            dedupe = http_request.query_params.get("dedupe", "true").lower() != "false"
+        else:
+            request = BatchRequest.model_validate_json(body)
+            questions = [parse_question(item, i) for i, item in enumerate(request.questions)]
+            concurrency, dedupe = request.concurrency, request.dedupe
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Lote inválido: {str(e)}")
+    if not questions:
+        raise HTTPException(status_code=400, detail="Lote vazio")
+    logger.info(f"Lote recebido: {len(questions)} perguntas")
+
+    async def lines():
+        batch = iter_batch(questions, concurrency, dedupe, **context.agents())
+        try:
+            async for record in batch:
+                if await http_request.is_disconnected():
+                    logger.info("Cliente desconectou; lote interrompido.")
+                    break
+                yield json.dumps(record) + "\n"
+        finally:
+            await batch.aclose()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/api/cache/stats")
+async def cache_stats(context: AppContext = Depends(get_context)):
+    cache = context.api.search_cache
+    return {"esearch": cache.stats() if cache is not None else None}
+
+@app.post("/api/harvest")
+async def harvest(request: HarvestRequest, context: AppContext = Depends(get_context)):
+    """
+    Coleta o conjunto completo de uma query via History server, em NDJSON: a primeira
+    linha traz o Count total e as seguintes, um artigo cada.
+    """
+    api = context.api
+    try:
+        history = await api.esearch_history(request.query)
+    except QuerySyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Query inválida: {str(e)}")
+    except (httpx.HTTPError, ET.ParseError) as e:
+        logger.error(f"Erro no esearch (history): {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Erro no esearch: {str(e)}")
+
+    async def lines():
+        yield json.dumps({"query": request.query, "count": history.count}) + "\n"
+        async for article in api.harvest(history, batch_size=request.batch_size, max_records=request.max_records):
+            yield json.dumps(article.to_dict()) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: SearchRequest, jobs: JobManager = Depends(get_jobs)):
+    try:
+        job_id, created = await jobs.submit(request.model_dump())
+    except QueueFullError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    job = await jobs.get(job_id)
+    return JSONResponse(
+        status_code=202 if created else 200,
+        content={"job_id": job_id, "status": job["status"], "deduplicated": not created},
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, jobs: JobManager = Depends(get_jobs)):
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str, jobs: JobManager = Depends(get_jobs)):
+    job = await jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
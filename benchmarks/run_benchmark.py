@@ -0,0 +1,142 @@
+"""
+Benchmark offline do pipeline de busca: E-utilities e Anthropic são substituídos por
+respostas gravadas em benchmarks/fixtures, com latência simulada.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.run_benchmark --target api --requests 50 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+import httpx
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ.setdefault("PUBMED_EMAIL", "benchmark@example.org")
+
+PICOTT_TEXT = "Pacientes com AVC isquêmico e fibrilação atrial tratados com apixabana para prevenção secundária"
+VALIDATED_QUERY = "stroke patients with atrial fibrillation treated with apixaban for secondary prevention"
+QUERIES = [
+    "stroke patients atrial",
+    '"stroke" AND "apixaban"',
+    '("stroke" OR "atrial fibrillation") AND ("apixaban" OR "Eliquis")',
+]
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+async def bench_searcher(i):
+    from agents.pubmed_searcher import PubmedSearcher
+    articles, _ = await PubmedSearcher().search_pubmed(QUERIES[i % len(QUERIES)])
+    return {"articles": len(articles)}
+
+async def bench_refiner(i):
+    from agents.search_refiner import SearchRefiner
+    abstracts = [f"Apixaban reduced recurrent stroke in AF cohort {i}."] * 5
+    await SearchRefiner().refine_search(QUERIES[i % len(QUERIES)], abstracts, VALIDATED_QUERY, 412)
+    return {}
+
+def make_bench_api():
+    import api
+    client = None
+
+    async def bench_api(i):
+        nonlocal client
+        if client is None:
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://benchmark", timeout=None)
+        response = await client.post("/api/search", json={"picott_text": PICOTT_TEXT})
+        response.raise_for_status()
+        return {"iterations": response.json()["iterations"], "articles": response.json()["total_results"]}
+
+    # O ASGITransport não dispara o lifespan; o benchmark o executa em volta das requisições
+    bench_api.lifespan = lambda: api.lifespan(api.app)
+    return bench_api
+
+async def run(bench, total, concurrency):
+    lifespan = getattr(bench, "lifespan", None)
+    if lifespan is not None:
+        async with lifespan():
+            return await _run(bench, total, concurrency)
+    return await _run(bench, total, concurrency)
+
+async def _run(bench, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, infos, errors = [], [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                infos.append(await bench(i))
+            except Exception as e:
+                errors += 1
+                print(f"Erro na requisição {i}: {e}")
+            latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    iterations = [info["iterations"] for info in infos if "iterations" in info]
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total / wall, 2),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "iterations_mean": round(sum(iterations) / len(iterations), 2) if iterations else None,
+        "tracemalloc_peak_mb": round(peak / 1024 / 1024, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark offline do PUBMED_CREW")
+    parser.add_argument("--target", choices=["searcher", "refiner", "api"], default="api")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--ncbi-latency-ms", type=float, default=150)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--ncbi-rate", type=float, default=None,
+                        help="Sobrescreve o limite de req/s do NCBI (padrão: o mesmo do cliente real)")
+    parser.add_argument("--llm-cache", action="store_true", help="Mantém o cache de respostas da LLM ativo")
+    parser.add_argument("--cache-dir", default=None, help="Diretório de cache (padrão: temporário e vazio)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Grava o relatório em JSON")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.environ["PUBMED_CACHE_DIR"] = args.cache_dir or tempfile.mkdtemp(prefix="pubmed_bench_")
+    if not args.llm_cache:
+        os.environ["LLM_CACHE_ENABLED"] = "0"
+
+    from benchmarks.stubs import offline_services
+
+    with offline_services(args.ncbi_latency_ms / 1000, args.llm_latency_ms / 1000, args.ncbi_rate) as (eutils, llm, api):
+        bench = {"searcher": bench_searcher, "refiner": bench_refiner}.get(args.target) or make_bench_api()
+        report = asyncio.run(run(bench, args.requests, args.concurrency))
+        report["target"] = args.target
+        report["eutils_calls"] = dict(eutils.calls)
+        report["llm_calls"] = dict(llm.calls)
+        report["esearch_cache"] = api.search_cache.stats()
+
+    for key, value in report.items():
+        print(f"{key:>22}: {value}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
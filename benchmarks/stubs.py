@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+import httpx
+from utils.llm_interface import build_router
+from utils.pubmed_api import PubmedAPI
+from utils.rate_limiter import TokenBucket
+from utils.search_cache import normalize_query
+
+FIXTURES = Path(__file__).parent / "fixtures"
+CURRENT_QUERY_RE = re.compile(r'Query atual no PubMed: "(.*)"')
+
+class EutilsReplay:
+    """
+    Substituto local do E-utilities: responde esearch/efetch com o XML gravado em fixtures/,
+    após uma latência simulada.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        recorded = json.loads((FIXTURES / "esearch.json").read_text(encoding="utf-8"))
+        self.esearch = {normalize_query(term): xml for term, xml in recorded["responses"].items()}
+        self.esearch_default = recorded["default"]
+        root = ET.parse(FIXTURES / "efetch.xml").getroot()
+        self.articles = {
+            article.findtext("MedlineCitation/PMID"): ET.tostring(article, encoding="unicode")
+            for article in root.findall("PubmedArticle")
+        }
+
+    async def __call__(self, request):
+        await asyncio.sleep(self.latency)
+        params = request.url.params
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        if params.get("rettype") == "count":
+            endpoint = "esearch.fcgi(count)"
+        self.calls[endpoint] += 1
+        if endpoint.startswith("esearch.fcgi"):
+            return httpx.Response(200, text=self.esearch.get(normalize_query(params["term"]), self.esearch_default))
+        if "id" in params:
+            pmids = params["id"].split(",")
+        else:
+            start = int(params.get("retstart", 0))
+            pmids = list(self.articles)[start:start + int(params.get("retmax", 20))]
+        body = "".join(self.articles[pmid] for pmid in pmids if pmid in self.articles)
+        return httpx.Response(200, text=f"<PubmedArticleSet>{body}</PubmedArticleSet>")
+
+    def transport(self):
+        return httpx.MockTransport(self)
+
+class AnthropicReplay:
+    """
+    Substituto do cliente Anthropic com respostas gravadas em fixtures/llm.json.
+    A resposta do refinador é escolhida pela query atual presente no prompt.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.responses = json.loads((FIXTURES / "llm.json").read_text(encoding="utf-8"))
+        self.refinements = {normalize_query(query): refined for query, refined in self.responses["refinements"].items()}
+
+    def _reply(self, prompt):
+        if "Analise a seguinte query" in prompt:
+            self.calls["validation"] += 1
+            return self.responses["validation"]
+        self.calls["refinement"] += 1
+        match = CURRENT_QUERY_RE.search(prompt)
+        current = normalize_query(match.group(1)) if match else ""
+        return self.refinements.get(current, self.responses["default_refinement"])
+
+    async def create(self, model, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        prompt = messages[0]["content"]
+        text = self._reply(prompt)
+        return SimpleNamespace(
+            model=model,
+            content=[SimpleNamespace(type="text", text=text)],
+            usage=SimpleNamespace(input_tokens=len(prompt) // 4, output_tokens=len(text) // 4),
+        )
+
+    async def close(self):
+        pass
+
+    def client(self):
+        """
+        Substitui o AsyncAnthropic do roteador de LLM: expõe apenas `messages.create` e `close`.
+        """
+        return SimpleNamespace(messages=self, close=self.close)
+
+@contextmanager
+def offline_services(ncbi_latency=0.0, llm_latency=0.0, ncbi_rate=None):
+    """
+    Instala os substitutos do E-utilities e da Anthropic no cliente PubMed e no roteador de LLM
+    compartilhados. Apenas os modelos Anthropic das rotas configuradas são usados.
+    """
+    eutils = EutilsReplay(ncbi_latency)
+    llm = AnthropicReplay(llm_latency)
+    api = PubmedAPI(client=httpx.AsyncClient(transport=eutils.transport()))
+    if ncbi_rate:
+        api.limiter = TokenBucket(ncbi_rate)
+    with patch.dict("os.environ", {"ANTHROPIC_API_KEY": "offline"}):
+        os.environ.pop("DEEPSEEK_API_KEY", None)
+        router = build_router(clients={"anthropic": llm.client()})
+    with patch("utils.pubmed_api._shared_api", api), patch("utils.llm_interface._shared_router", router):
+        yield eutils, llm, api
@@ -1,92 +1,84 @@
 # C:\Users\Usuario\Desktop\projetos\PUBMED_CREW\main.py
 import os
+import argparse
+import asyncio
 import logging
 from dotenv import load_dotenv
-from agents.query_validator import QueryValidator
-from agents.pubmed_searcher import PubmedSearcher
-from agents.search_refiner import SearchRefiner
+from agents.app_context import AppContext
+from agents.batch_search import MAX_BATCH_CONCURRENCY, load_questions, parse_concurrency, run_batch
+from agents.query_validator import QueryValidationError
+from agents.search_pipeline import run_search
+from utils.llm_interface import LLMUnavailableError
 
 load_dotenv()
 
-required_vars = ["ANTHROPIC_API_KEY", "PUBMED_EMAIL"]
-for var in required_vars:
-    if not os.getenv(var):
-        raise ValueError(f"Variável de ambiente {var} não definida no .env")
+# Mesmas exigências de AppContext.create(): o espelho local dispensa PUBMED_EMAIL e qualquer
+# provedor de LLM com chave basta
+AppContext.check_config()
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
+async def _search(user_query):
+    context = AppContext.create()
+    try:
+        return await run_search(user_query, **context.agents())
+    finally:
+        await context.aclose()
+
+async def _batch(questions, output, concurrency):
+    context = AppContext.create()
+    try:
+        return await run_batch(questions, output, concurrency, **context.agents())
+    finally:
+        await context.aclose()
+
+def _concurrency_arg(value):
+    try:
+        return parse_concurrency(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def batch_main(args):
+    questions = load_questions(args.batch)
+    summary = asyncio.run(_batch(questions, args.output, args.concurrency))
+    print(f"{len(questions)} perguntas processadas ({summary}); resultados em {args.output}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Busca no PubMed a partir de perguntas PICOTT")
+    parser.add_argument("--batch", help="arquivo JSONL com uma pergunta por linha (modo em lote)")
+    parser.add_argument("--output", default="results.jsonl", help="saída do modo em lote (.jsonl ou .parquet)")
+    parser.add_argument(
+        "--concurrency", type=_concurrency_arg, default=None,
+        help=f"buscas simultâneas no modo em lote (1 a {MAX_BATCH_CONCURRENCY})",
+    )
+    args = parser.parse_args()
+    if args.batch:
+        batch_main(args)
+        return
+
     user_query = input("Digite sua query: ")
     logger.info(f"Query recebida: {user_query}")
-    
-    validator = QueryValidator()
-    searcher = PubmedSearcher()
-    refiner = SearchRefiner()
 
-    is_valid, validated_query = validator.validate_query(user_query)
-    if not is_valid:
+    try:
+        result = asyncio.run(_search(user_query))
+    except QueryValidationError:
         logger.error("Query inválida: deve conter população e intervenção.")
         print("A query deve conter pelo menos uma população específica e uma intervenção.")
         return
-    logger.info(f"Query validada e traduzida: {validated_query}")
-
-    initial_query = searcher.build_initial_query(validated_query)
-    abstracts, pmids = searcher.search_pubmed(initial_query)
-
-    if not pmids:
-        logger.warning("Nenhum resultado na busca inicial.")
-
-    current_query = initial_query
-    iteration = 0
-    max_initial_iterations = 3
-    max_additional_iterations = 5
-    min_abstracts = 20  # Número mínimo de abstracts desejado
-
-    while True:
-        iteration += 1
-        logger.info(f"Iteração {iteration} - Query atual: {current_query}")
-        refined_query = refiner.refine_search(current_query, abstracts, validated_query)
-        logger.info(f"Query refinada: {refined_query}")
-
-        # Verificar se a query não mudou e há resultados suficientes
-        if refined_query == current_query and pmids and len(abstracts) >= min_abstracts:
-            logger.info("Busca finalizada com resultados suficientes.")
-            print(f"Pesquise no PubMed com esta query:\n{refined_query}")
-            print("\nResultados encontrados:")
-            for pmid, abstract in zip(pmids, abstracts):
-                print(f"PMID: {pmid}\nAbstract: {abstract}\n")
-            break
-
-        # Verificar limite inicial de iterações
-        if iteration > max_initial_iterations:
-            if len(abstracts) >= min_abstracts:
-                logger.info(f"Limite inicial de iterações atingido, mas número de abstracts suficiente ({len(abstracts)}).")
-                print(f"Pesquise no PubMed com esta query:\n{refined_query}")
-                print("\nResultados encontrados:")
-                for pmid, abstract in zip(pmids, abstracts):
-                    print(f"PMID: {pmid}\nAbstract: {abstract}\n")
-                break
-            else:
-                logger.warning(f"Limite inicial de iterações atingido, mas número de abstracts insuficiente ({len(abstracts)}). Tentando mais {max_additional_iterations} iterações.")
-
-        # Verificar limite total de iterações (inicial + adicionais)
-        if iteration > (max_initial_iterations + max_additional_iterations):
-            logger.warning("Limite total de iterações atingido.")
-            print(f"Pesquise no PubMed com esta query (melhor tentativa):\n{refined_query}")
-            if pmids:
-                print("\nResultados encontrados:")
-                for pmid, abstract in zip(pmids, abstracts):
-                    print(f"PMID: {pmid}\nAbstract: {abstract}\n")
-            break
-
-        current_query = refined_query
-        abstracts, pmids = searcher.search_pubmed(current_query)
-        logger.info(f"Novos resultados - PMIDs: {pmids}, Abstracts: {len(abstracts)} encontrados")
+    except LLMUnavailableError as e:
+        logger.error(f"LLM indisponível: {e}")
+        print("Nenhum modelo de LLM respondeu; tente novamente mais tarde.")
+        return
 
-        # Permitir mais refinamentos na primeira iteração se não houver resultados
-        if not pmids and iteration == 1:
-            logger.info("Primeira iteração sem resultados; permitindo mais refinamentos.")
+    if result["exhausted"]:
+        print(f"Pesquise no PubMed com esta query (melhor tentativa):\n{result['query']}")
+    else:
+        print(f"Pesquise no PubMed com esta query:\n{result['query']}")
+    if result["results"]:
+        print(f"\nResultados encontrados ({result['total_results']} de {result['total_count']} no PubMed):")
+        for item in result["results"]:
+            print(f"PMID: {item['pmid']}\nTítulo: {item['title']}\nAbstract: {item['abstract']}\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Intervalo mínimo (s) entre atualizações de last_access de um mesmo registro; leituras repetidas
+# de artigos recém-acessados não geram escrita.
+TOUCH_INTERVAL = 300
+
+def default_cache_dir():
+    return os.getenv("PUBMED_CACHE_DIR", ".cache")
+
+class AbstractCache:
+    """
+    Cache persistente PMID -> registro do artigo (JSON) em SQLite, com despejo LRU quando o tamanho
+    total dos registros ultrapassa `max_bytes`. O total é mantido por triggers na tabela
+    cache_stats (válido mesmo com vários processos no mesmo arquivo). Os métodos são bloqueantes:
+    no event loop, chame-os via asyncio.to_thread.
+    """
+    def __init__(self, path=None, max_bytes=None):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "articles.sqlite3")
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("ABSTRACT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS articles (
+                pmid TEXT PRIMARY KEY, record TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_articles_last_access ON articles(last_access);
+            CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO cache_stats (name, value)
+                SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM articles;
+            CREATE TRIGGER IF NOT EXISTS articles_size_insert AFTER INSERT ON articles BEGIN
+                UPDATE cache_stats SET value = value + NEW.size WHERE name = 'total_bytes';
+            END;
+            CREATE TRIGGER IF NOT EXISTS articles_size_update AFTER UPDATE OF size ON articles BEGIN
+                UPDATE cache_stats SET value = value - OLD.size + NEW.size WHERE name = 'total_bytes';
+            END;
+            CREATE TRIGGER IF NOT EXISTS articles_size_delete AFTER DELETE ON articles BEGIN
+                UPDATE cache_stats SET value = value - OLD.size WHERE name = 'total_bytes';
+            END;
+            """
+        )
+        self.conn.commit()
+
+    def get_many(self, pmids):
+        if not pmids:
+            return {}
+        placeholders = ",".join("?" * len(pmids))
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT pmid, record, last_access FROM articles WHERE pmid IN ({placeholders})", list(pmids)
+            ).fetchall()
+            stale = [(now, pmid) for pmid, _, last_access in rows if last_access < now - TOUCH_INTERVAL]
+            if stale:
+                self.conn.executemany("UPDATE articles SET last_access = ? WHERE pmid = ?", stale)
+                self.conn.commit()
+        return {pmid: record for pmid, record, _ in rows}
+
+    def put_many(self, records):
+        if not records:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO articles (pmid, record, size, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(pmid) DO UPDATE SET record = excluded.record, size = excluded.size, "
+                "last_access = excluded.last_access",
+                [(pmid, text, len(text.encode("utf-8")), now) for pmid, text in records.items()],
+            )
+            self._evict()
+            self.conn.commit()
+
+    def total_bytes(self):
+        return self.conn.execute("SELECT value FROM cache_stats WHERE name = 'total_bytes'").fetchone()[0]
+
+    def _evict(self):
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        removed = 0
+        victims = []
+        for pmid, size in self.conn.execute("SELECT pmid, size FROM articles ORDER BY last_access"):
+            if removed >= excess:
+                break
+            victims.append((pmid,))
+            removed += size
+        self.conn.executemany("DELETE FROM articles WHERE pmid = ?", victims)
+        logger.info(f"Cache de artigos: {len(victims)} entradas removidas ({removed} bytes)")
+
+    def close(self):
+        self.conn.close()
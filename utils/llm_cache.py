@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from utils.abstract_cache import default_cache_dir
+from utils.metrics import record_cache, stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPERATURE = 0.8
+
+def llm_temperature():
+    """
+    Temperatura das chamadas à LLM: 0 no modo determinístico (LLM_DETERMINISTIC=1), para que
+    as respostas em cache sejam reaproveitáveis; caso contrário, a temperatura padrão.
+    """
+    return 0.0 if os.getenv("LLM_DETERMINISTIC") == "1" else DEFAULT_TEMPERATURE
+
+class LLMCache:
+    """
+    Cache persistente de respostas da LLM, endereçado pelo hash de tarefa, parâmetros e prompt,
+    com despejo LRU acima de `max_entries`. Os métodos são bloqueantes: no event loop, chame-os
+    via asyncio.to_thread.
+    """
+    def __init__(self, path=None, max_entries=None):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "llm.sqlite3")
+        self.max_entries = max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(task, prompt, **params):
+        payload = json.dumps({"task": task, "prompt": prompt, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+        return row[0] if row else None
+
+    def put(self, key, model, response):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, last_access) VALUES (?, ?, ?, ?)",
+                (key, model, response, time.time()),
+            )
+            excess = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (excess,),
+                )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+_shared_cache = None
+
+def get_llm_cache():
+    """
+    Retorna o cache de respostas compartilhado pelo processo, ou None se LLM_CACHE_ENABLED=0.
+    """
+    global _shared_cache
+    if os.getenv("LLM_CACHE_ENABLED", "1") == "0":
+        return None
+    if _shared_cache is None:
+        _shared_cache = LLMCache()
+    return _shared_cache
+
+async def create_message(router, task, prompt, max_tokens=4000, temperature=None, variant=0, cache=None):
+    """
+    Envia o prompt pelo roteador de LLM para a rota `task`, servindo do cache quando a mesma
+    combinação de tarefa, parâmetros e prompt já foi respondida (por qualquer modelo da rota).
+    `variant` separa no cache chamadas paralelas intencionalmente diferentes (ex.: candidatas do
+    refinador); ele não altera a chamada, então quem chama deve variar o prompt de cada uma.
+    """
+    temperature = llm_temperature() if temperature is None else temperature
+    key = None
+    if cache is not None:
+        key = LLMCache.make_key(task, prompt, max_tokens=max_tokens, temperature=temperature, variant=variant)
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            record_cache("llm", hits=1)
+            logger.debug(f"Resposta da LLM em cache ({task})")
+            return cached
+        record_cache("llm", hits=0, misses=1)
+    with stage("llm", task=task):
+        response, model = await router.complete(task, prompt, max_tokens=max_tokens, temperature=temperature)
+    logger.debug(f"Resposta da LLM ({task}) por {model}")
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, model, response)
+    return response
@@ -1,38 +1,262 @@
-from openai import OpenAI, OpenAIError
+from anthropic import AsyncAnthropic
+from openai import AsyncOpenAI
+import asyncio
 import os
+import time
 import logging
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from utils.metrics import LLM_HEDGES, LLM_REQUESTS, LLM_TOKENS
 
 logger = logging.getLogger(__name__)
 
-class LLMInterface:
-    def __init__(self):
-        api_key = os.getenv("DEEPSEEK_API_KEY")
-        if not api_key:
-            raise ValueError("DEEPSEEK_API_KEY não definida no .env")
-        self.client = OpenAI(
-            api_key=api_key,
+ModelSpec = namedtuple("ModelSpec", ["provider", "model"])
+
+# Rotas padrão (provedor:modelo, em ordem de preferência); a validação usa um modelo menor e mais rápido.
+DEFAULT_ROUTES = {
+    "validation": "anthropic:claude-3-5-haiku-20241022,anthropic:claude-3-7-sonnet-20250219,deepseek:deepseek-chat",
+    "refinement": "anthropic:claude-3-7-sonnet-20250219,deepseek:deepseek-reasoner",
+}
+
+class LLMUnavailableError(Exception):
+    pass
+
+class LLMInterface(ABC):
+    """
+    Provedor de LLM assíncrono. Cada instância guarda a média móvel exponencial da sua latência
+    e, após uma falha, fica em quarentena por `cooldown` segundos para o roteador.
+    """
+    provider = None
+
+    def __init__(self, model, client):
+        self.model = model
+        self.client = client
+        self.latency = None
+        self.failed_until = 0.0
+
+    @property
+    def name(self):
+        return f"{self.provider}:{self.model}"
+
+    @property
+    def cooling_down(self):
+        return time.monotonic() < self.failed_until
+
+    def record_latency(self, elapsed, alpha=0.3):
+        self.latency = elapsed if self.latency is None else alpha * elapsed + (1 - alpha) * self.latency
+
+    @abstractmethod
+    async def complete(self, prompt, max_tokens, temperature):
+        """
+        Envia o prompt ao modelo e retorna o texto da resposta.
+        """
+
+    async def aclose(self):
+        await self.client.close()
+
+class AnthropicInterface(LLMInterface):
+    provider = "anthropic"
+
+    def __init__(self, model, client=None):
+        super().__init__(model, client or AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY")))
+
+    async def complete(self, prompt, max_tokens, temperature):
+        message = await self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+        usage = getattr(message, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.labels(self.model, "input").inc(usage.input_tokens)
+            LLM_TOKENS.labels(self.model, "output").inc(usage.output_tokens)
+        return message.content[0].text.strip()
+
+class DeepSeekInterface(LLMInterface):
+    provider = "deepseek"
+
+    def __init__(self, model, client=None):
+        super().__init__(model, client or AsyncOpenAI(
+            api_key=os.getenv("DEEPSEEK_API_KEY"),
             base_url="https://api.deepseek.com"
+        ))
+
+    async def complete(self, prompt, max_tokens, temperature):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant"},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=False
         )
-        self.model = "deepseek-reasoner"
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.labels(self.model, "input").inc(usage.prompt_tokens)
+            LLM_TOKENS.labels(self.model, "output").inc(usage.completion_tokens)
+        return response.choices[0].message.content.strip()
 
-    def generate(self, prompt):
-        logger.debug(f"Enviando prompt para DeepSeek: {prompt}")
+PROVIDERS = {
+    "anthropic": (AnthropicInterface, "ANTHROPIC_API_KEY"),
+    "deepseek": (DeepSeekInterface, "DEEPSEEK_API_KEY"),
+}
+
+def parse_route(spec):
+    """
+    Converte "provedor:modelo,provedor:modelo" em uma lista de ModelSpec.
+    """
+    specs = []
+    for item in spec.split(","):
+        provider, _, model = item.strip().partition(":")
+        if provider not in PROVIDERS or not model:
+            raise ValueError(f"Modelo de LLM inválido na rota: {item!r}")
+        specs.append(ModelSpec(provider, model))
+    return specs
+
+def route_specs():
+    """
+    Rotas configuradas: LLM_<TAREFA>_MODELS (ex.: LLM_VALIDATION_MODELS) substitui a rota padrão.
+    """
+    return {task: parse_route(os.getenv(f"LLM_{task.upper()}_MODELS", default)) for task, default in DEFAULT_ROUTES.items()}
+
+class LLMRouter:
+    """
+    Encaminha cada tarefa ("validation", "refinement") aos modelos da sua rota. Os modelos
+    saudáveis são ordenados pela latência observada (os ainda sem medição seguem a ordem
+    configurada); se o primeiro não responde em `hedge_after` segundos (ou 2x sua latência
+    média), a mesma chamada é disparada no próximo e vale a primeira resposta. Erros e
+    timeouts passam imediatamente ao próximo modelo e colocam o que falhou em quarentena.
+    """
+    def __init__(self, routes, timeout=None, hedge_after=None, cooldown=None):
+        self.routes = routes
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+        self.hedge_after = hedge_after or float(os.getenv("LLM_HEDGE_SECONDS", "10"))
+        self.cooldown = cooldown or float(os.getenv("LLM_COOLDOWN_SECONDS", "30"))
+
+    def candidates(self, task):
+        providers = self.routes.get(task)
+        if not providers:
+            raise LLMUnavailableError(f"Nenhum modelo configurado para a tarefa {task}")
+        ranked = sorted(
+            enumerate(providers),
+            key=lambda item: (
+                item[1].cooling_down,
+                item[1].latency if item[1].latency is not None else float("inf"),
+                item[0],
+            ),
+        )
+        return [provider for _, provider in ranked]
+
+    def hedge_delay(self, provider):
+        if provider.latency is None:
+            return self.hedge_after
+        return max(1.0, min(self.hedge_after, 2 * provider.latency))
+
+    async def _call(self, provider, prompt, max_tokens, temperature):
+        start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(provider.complete(prompt, max_tokens, temperature), self.timeout)
+        except asyncio.TimeoutError:
+            provider.record_latency(self.timeout)
+            provider.failed_until = time.monotonic() + self.cooldown
+            LLM_REQUESTS.labels(provider.name, "timeout").inc()
+            raise
+        except asyncio.CancelledError:
+            LLM_REQUESTS.labels(provider.name, "cancelled").inc()
+            raise
+        except Exception:
+            provider.failed_until = time.monotonic() + self.cooldown
+            LLM_REQUESTS.labels(provider.name, "error").inc()
+            raise
+        provider.record_latency(time.monotonic() - start)
+        LLM_REQUESTS.labels(provider.name, "ok").inc()
+        return response
+
+    async def complete(self, task, prompt, max_tokens=4000, temperature=0.0):
+        """
+        Retorna (resposta, nome do modelo que respondeu). Levanta LLMUnavailableError se todos falharem.
+        """
+        remaining = self.candidates(task)
+        pending = {}
+        errors = []
+
+        def launch():
+            if not remaining:
+                return False
+            provider = remaining.pop(0)
+            logger.debug(f"LLM {task}: chamando {provider.name}")
+            pending[asyncio.create_task(self._call(provider, prompt, max_tokens, temperature))] = provider
+            return True
+
+        launch()
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=int(os.getenv("DEFAULT_MAX_OUTPUT_TOKENS", 4000)),
-                stream=False
-            )
-            content = response.choices[0].message.content
-            logger.debug(f"Resposta da DeepSeek: {content}")
-            return content
-        except OpenAIError as e:
-            logger.error(f"Erro na API DeepSeek: {e}")
-            return "Erro na resposta da LLM"
-        except Exception as e:
-            logger.error(f"Erro inesperado ao chamar DeepSeek API: {e}")
-            return "Erro desconhecido"
\ No newline at end of file
+            while pending:
+                leader = next(iter(pending.values()))
+                timeout = self.hedge_delay(leader) if remaining else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.warning(f"LLM {task}: {leader.name} lento; disparando chamada em paralelo")
+                    LLM_HEDGES.labels(task).inc()
+                    launch()
+                    continue
+                for finished in done:
+                    provider = pending.pop(finished)
+                    try:
+                        return finished.result(), provider.name
+                    except Exception as e:
+                        logger.warning(f"LLM {task}: falha em {provider.name} ({type(e).__name__}: {e})")
+                        errors.append(f"{provider.name}: {type(e).__name__}")
+                        launch()
+            raise LLMUnavailableError(f"Nenhum modelo respondeu à tarefa {task} ({'; '.join(errors)})")
+        finally:
+            for leftover in pending:
+                leftover.cancel()
+
+    async def aclose(self):
+        clients = {id(provider.client): provider for providers in self.routes.values() for provider in providers}
+        for provider in clients.values():
+            await provider.aclose()
+
+def build_router(clients=None):
+    """
+    Monta o roteador a partir das rotas configuradas, ignorando provedores sem chave de API.
+    Um cliente por provedor é compartilhado por todos os seus modelos; `clients` permite injetá-los.
+    """
+    clients = dict(clients or {})
+    routes = {}
+    for task, specs in route_specs().items():
+        providers = []
+        for spec in specs:
+            interface, key_var = PROVIDERS[spec.provider]
+            if spec.provider not in clients and not os.getenv(key_var):
+                continue
+            provider = interface(spec.model, client=clients.get(spec.provider))
+            clients.setdefault(spec.provider, provider.client)
+            providers.append(provider)
+        if not providers:
+            raise ValueError(f"Nenhum provedor de LLM disponível para {task}; defina ANTHROPIC_API_KEY ou DEEPSEEK_API_KEY")
+        routes[task] = providers
+        logger.info(f"Rota LLM {task}: {', '.join(provider.name for provider in providers)}")
+    return LLMRouter(routes)
+
+_shared_router = None
+
+def get_llm_router():
+    """
+    Retorna o roteador de LLM compartilhado pelo processo (clientes e estatísticas de latência únicos).
+    """
+    global _shared_router
+    if _shared_router is None:
+        _shared_router = build_router()
+    return _shared_router
+
+async def close_llm_router():
+    global _shared_router
+    if _shared_router is not None:
+        await _shared_router.aclose()
+        _shared_router = None
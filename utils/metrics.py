@@ -0,0 +1,68 @@
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram
+
+try:
+    from opentelemetry import trace
+except ImportError:  # OpenTelemetry é opcional
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+_tracer = trace.get_tracer("pubmed_crew") if trace is not None else None
+
+STAGE_SECONDS = Histogram(
+    "pubmed_crew_stage_seconds",
+    "Duração de cada etapa da busca",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+CACHE_LOOKUPS = Counter("pubmed_crew_cache_lookups_total", "Consultas aos caches", ["cache", "result"])
+RETRIES = Counter("pubmed_crew_retries_total", "Novas tentativas de requisições ao E-utilities", ["endpoint", "reason"])
+LLM_TOKENS = Counter("pubmed_crew_llm_tokens_total", "Tokens consumidos nas chamadas à LLM", ["model", "kind"])
+LLM_REQUESTS = Counter("pubmed_crew_llm_requests_total", "Chamadas a cada modelo de LLM por resultado", ["model", "result"])
+LLM_HEDGES = Counter("pubmed_crew_llm_hedges_total", "Chamadas paralelas disparadas por lentidão do modelo", ["task"])
+ITERATIONS = Histogram(
+    "pubmed_crew_iterations",
+    "Iterações de refinamento por busca",
+    buckets=(1, 2, 3, 4, 5, 6, 7, 8, 9, 10),
+)
+
+# Span da etapa em andamento, pai dos spans abertos dentro dela (inclusive em tarefas criadas
+# a partir dela, que herdam uma cópia do contexto).
+_parent_span = ContextVar("pubmed_crew_parent_span", default=None)
+
+@contextmanager
+def stage(name, parent=None, **attributes):
+    """
+    Mede a duração de uma etapa no histograma STAGE_SECONDS e, se o OpenTelemetry estiver
+    instalado, registra um span com os atributos informados, filho de `parent` ou, na falta
+    dele, da etapa em andamento. O pai é passado explicitamente (context=...) em vez de tornar
+    o span "current" no OpenTelemetry, cujo token não pode ser restaurado quando a etapa
+    atravessa os yields dos geradores assíncronos do pipeline.
+    """
+    span = previous = None
+    if _tracer is not None:
+        previous = _parent_span.get()
+        parent = parent or previous
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        span = _tracer.start_span(name, context=context, attributes=attributes)
+        _parent_span.set(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        if span is not None:
+            span.end()
+            _parent_span.set(previous)
+        logger.debug(f"Etapa {name} concluída em {elapsed:.3f}s")
+
+def record_cache(cache, hits, misses=0):
+    if hits:
+        CACHE_LOOKUPS.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache, "miss").inc(misses)
@@ -1,41 +1,340 @@
-import requests
+import asyncio
+import json
+import httpx
 import xml.etree.ElementTree as ET
 import os
+import sqlite3
 import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+from utils.abstract_cache import AbstractCache
+from utils.metrics import RETRIES, record_cache, stage
+from utils.pubmed_xml import ArticleStreamParser, PubmedArticle
+from utils.query_parser import QuerySyntaxError, parse
+from utils.rate_limiter import TokenBucket
+from utils.search_cache import SearchCache, normalize_query
 
 logger = logging.getLogger(__name__)
 
+# Limites do NCBI: 3 req/s sem api_key, 10 req/s com api_key
+RATE_WITHOUT_KEY = 3
+RATE_WITH_KEY = 10
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_HARVEST_RECORDS = 10000  # Teto de registros por coleta (harvest)
+
+def ncbi_rate(api_key):
+    """
+    Requisições por segundo permitidas a este processo. O limite total (NCBI_RATE, ou o limite
+    do NCBI para a chave) é dividido entre os workers do servidor (WEB_CONCURRENCY), pois cada
+    worker tem o seu próprio limitador.
+    """
+    total = float(os.getenv("NCBI_RATE") or (RATE_WITH_KEY if api_key else RATE_WITHOUT_KEY))
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return total / workers
+
+class EfetchError(Exception):
+    """
+    Falha de transporte ou de parsing no efetch: os artigos ausentes podem existir no PubMed.
+    """
+
+@dataclass
+class SearchResult:
+    pmids: List[str] = field(default_factory=list)
+    count: int = 0
+    webenv: Optional[str] = None
+    query_key: Optional[str] = None
+
 class PubmedAPI:
-    def __init__(self):
+    def __init__(self, client=None, max_retries=3, backoff=0.5, abstract_cache=None, search_cache=None):
         self.base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
         self.db = "pubmed"
         self.email = os.getenv("PUBMED_EMAIL")
         if not self.email:
             raise ValueError("PUBMED_EMAIL não definida no .env")
+        self.api_key = os.getenv("NCBI_API_KEY")
         self.headers = {"User-Agent": "PUBMED_CREW/1.0"}
+        self.client = client or httpx.AsyncClient(
+            headers=self.headers,
+            timeout=10,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+        self.limiter = TokenBucket(ncbi_rate(self.api_key))
+        logger.info(f"Limite de requisições ao NCBI: {self.limiter.rate:.2f}/s neste processo")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retmax = int(os.getenv("PUBMED_RETMAX", "20"))
+        self.abstract_cache = abstract_cache or AbstractCache()
+        self.search_cache = search_cache or SearchCache()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def health(self):
+        """
+        Verificações locais de prontidão (sem chamadas ao NCBI): cliente HTTP aberto e caches respondendo.
+        """
+        try:
+            for cache in (self.search_cache, self.abstract_cache):
+                cache.conn.execute("SELECT 1")
+            caches = True
+        except sqlite3.Error:
+            caches = False
+        return {"pubmed_client": not self.client.is_closed, "caches": caches}
+
+    def _retry_delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2 ** attempt)
 
-    def esearch(self, query):
-        url = f"{self.base_url}esearch.fcgi?db={self.db}&term={query}&retmax=10&retmode=xml&email={self.email}"
-        logger.info(f"Enviando esearch URL: {url}")
-        try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            root = ET.fromstring(response.content)
-            id_list = [id_elem.text for id_elem in root.findall(".//Id")]
-            logger.info(f"PMIDs encontrados: {id_list}")
-            return id_list
-        except requests.RequestException as e:
+    async def _send(self, endpoint, params, stream=False):
+        url = f"{self.base_url}{endpoint}"
+        params = {"db": self.db, "tool": "PUBMED_CREW", "email": self.email, **params}
+        if self.api_key:
+            params["api_key"] = self.api_key
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            request = self.client.build_request("GET", url, params=params)
+            try:
+                response = await self.client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                RETRIES.labels(endpoint, "transport").inc()
+                logger.warning(f"Falha de conexão em {endpoint} ({e}); nova tentativa em {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    if response.is_error and stream:
+                        await response.aclose()
+                    response.raise_for_status()
+                    return response
+                if stream:
+                    await response.aclose()
+                delay = self._retry_delay(attempt, response)
+                RETRIES.labels(endpoint, str(response.status_code)).inc()
+                logger.warning(f"HTTP {response.status_code} em {endpoint}; nova tentativa em {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _get(self, endpoint, params):
+        return await self._send(endpoint, params)
+
+    async def esearch(self, query, retmax=None):
+        """
+        Retorna um SearchResult com até `retmax` PMIDs e o total real (Count) de resultados.
+        """
+        retmax = retmax or self.retmax
+        try:
+            parse(query)
+        except QuerySyntaxError as e:
+            logger.error(f"Query inválida, esearch não enviado ({e}): {query}")
+            return SearchResult()
+        cache_key = f"esearch:{retmax}|{normalize_query(query)}"
+        cached = await self.search_cache.get(cache_key)
+        if cached is not None:
+            record_cache("esearch", hits=1)
+            logger.info(f"esearch em cache: {query}")
+            return SearchResult(**cached)
+        record_cache("esearch", hits=0, misses=1)
+        logger.info(f"Enviando esearch: {query}")
+        try:
+            with stage("esearch"):
+                response = await self._get("esearch.fcgi", {"term": query, "retmax": retmax, "retmode": "xml"})
+            result = self._parse_esearch(response.content)
+            logger.info(f"PMIDs encontrados: {len(result.pmids)} de {result.count}")
+            await self.search_cache.set(cache_key, {"pmids": result.pmids, "count": result.count})
+            await self.search_cache.set(f"count|{normalize_query(query)}", {"count": result.count})
+            return result
+        except (httpx.HTTPError, ET.ParseError) as e:
             logger.error(f"Erro na busca esearch: {e}")
-            return []
+            return SearchResult()
 
-    def efetch_abstracts(self, pmids):
-        url = f"{self.base_url}efetch.fcgi?db={self.db}&id={','.join(pmids)}&rettype=abstract&retmode=text&email={self.email}"
-        logger.info(f"Enviando efetch URL: {url}")
+    async def count(self, query):
+        """
+        Total de resultados da query (esearch com rettype=count), sem baixar PMIDs nem abstracts.
+        Retorna 0 se a query for inválida ou a requisição falhar.
+        """
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            abstracts = response.text.split("\n\n")
-            return [abstract.strip() for abstract in abstracts if abstract.strip()]
-        except requests.RequestException as e:
+            parse(query)
+        except QuerySyntaxError as e:
+            logger.error(f"Query inválida, contagem não enviada ({e}): {query}")
+            return 0
+        cache_key = f"count|{normalize_query(query)}"
+        cached = await self.search_cache.get(cache_key)
+        if cached is not None:
+            record_cache("count", hits=1)
+            return cached["count"]
+        record_cache("count", hits=0, misses=1)
+        try:
+            with stage("count"):
+                response = await self._get("esearch.fcgi", {"term": query, "rettype": "count", "retmode": "xml"})
+            count = int(ET.fromstring(response.content).findtext("Count") or 0)
+        except (httpx.HTTPError, ET.ParseError, ValueError) as e:
+            logger.error(f"Erro na contagem esearch: {e}")
+            return 0
+        logger.info(f"Contagem: {count} para {query}")
+        await self.search_cache.set(cache_key, {"count": count})
+        return count
+
+    async def count_many(self, queries):
+        """
+        Contagens de várias queries em paralelo (limitadas pelo rate limiter), na ordem recebida.
+        Queries equivalentes após normalização são consultadas uma única vez.
+        """
+        unique = {}
+        for query in queries:
+            unique.setdefault(normalize_query(query), query)
+        counts = await asyncio.gather(*(self.count(query) for query in unique.values()))
+        by_key = dict(zip(unique, counts))
+        return [by_key[normalize_query(query)] for query in queries]
+
+    async def esearch_history(self, query):
+        """
+        esearch com usehistory=y: guarda o conjunto completo no History server do NCBI e
+        retorna Count, WebEnv e query_key para paginação via efetch.
+        Levanta QuerySyntaxError se a query for inválida, sem enviar a requisição.
+        """
+        parse(query)
+        logger.info(f"Enviando esearch (history): {query}")
+        with stage("esearch"):
+            response = await self._get("esearch.fcgi", {"term": query, "usehistory": "y", "retmax": 0, "retmode": "xml"})
+        return self._parse_esearch(response.content)
+
+    def _parse_esearch(self, content):
+        root = ET.fromstring(content)
+        return SearchResult(
+            pmids=[id_elem.text for id_elem in root.findall("IdList/Id")],
+            count=int(root.findtext("Count") or 0),
+            webenv=root.findtext("WebEnv"),
+            query_key=root.findtext("QueryKey"),
+        )
+
+    async def _stream_articles(self, params):
+        response = await self._send("efetch.fcgi", {"retmode": "xml", **params}, stream=True)
+        parser = ArticleStreamParser()
+        received = []
+        try:
+            async for chunk in response.aiter_bytes():
+                articles = parser.feed(chunk)
+                received.extend(articles)
+                for article in articles:
+                    yield article
+        finally:
+            await response.aclose()
+        articles = parser.close()
+        received.extend(articles)
+        for article in articles:
+            yield article
+        await self._store(received)
+
+    async def iter_articles(self, pmids, raise_errors=False):
+        """
+        Gera PubmedArticle para cada PMID: primeiro os que estão em cache, depois os demais,
+        lidos do efetch em XML com parser incremental. Em caso de falha, a geração termina
+        (artigos já gerados valem); com raise_errors=True, levanta EfetchError, para que quem
+        chama distinga uma falha de um PMID que o efetch de fato não retornou.
+        """
+        cached = await asyncio.to_thread(self.abstract_cache.get_many, pmids)
+        missing = [pmid for pmid in pmids if pmid not in cached]
+        logger.info(f"efetch: {len(cached)} PMIDs em cache, {len(missing)} a buscar")
+        record_cache("articles", hits=len(cached), misses=len(missing))
+        for pmid in pmids:
+            if pmid in cached:
+                yield PubmedArticle.from_dict(json.loads(cached[pmid]))
+        if not missing:
+            return
+        try:
+            with stage("efetch", pmids=len(missing)):
+                async for article in self._stream_articles({"id": ",".join(missing)}):
+                    yield article
+        except (httpx.HTTPError, ET.ParseError) as e:
             logger.error(f"Erro na busca efetch: {e}")
-            return []
\ No newline at end of file
+            if raise_errors:
+                raise EfetchError(str(e)) from e
+
+    async def harvest(self, history, batch_size=200, max_records=None, concurrency=3):
+        """
+        Percorre o conjunto guardado por esearch_history em lotes de `batch_size`, com até
+        `concurrency` efetch simultâneos, gerando os artigos à medida que os lotes chegam.
+        """
+        total = history.count if max_records is None else min(history.count, max_records)
+        starts = iter(range(0, total, batch_size))
+        queue = asyncio.Queue(maxsize=concurrency)
+        logger.info(f"Harvest: {total} de {history.count} registros em lotes de {batch_size}")
+
+        async def worker():
+            for retstart in starts:
+                params = {
+                    "WebEnv": history.webenv,
+                    "query_key": history.query_key,
+                    "retstart": retstart,
+                    "retmax": min(batch_size, total - retstart),
+                }
+                with stage("efetch", pmids=params["retmax"]):
+                    batch = [article async for article in self._stream_articles(params)]
+                await queue.put(batch)
+
+        async def produce():
+            # Fim da fila: None, ou a exceção do worker que falhou (os demais são cancelados,
+            # senão ficariam bloqueados para sempre em queue.put)
+            workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+            try:
+                await asyncio.gather(*workers)
+                end = None
+            except Exception as e:
+                end = e
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+            await queue.put(end)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (batch := await queue.get()) is not None:
+                if isinstance(batch, Exception):
+                    raise batch
+                for article in batch:
+                    yield article
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def _store(self, articles):
+        """
+        Grava no cache, em uma única transação fora do event loop, os artigos de uma resposta do efetch.
+        """
+        records = {article.pmid: json.dumps(article.to_dict()) for article in articles}
+        await asyncio.to_thread(self.abstract_cache.put_many, records)
+
+    async def efetch_articles(self, pmids):
+        """
+        Retorna os artigos na mesma ordem de `pmids`, omitindo os que o efetch não retornou.
+        """
+        articles = {article.pmid: article async for article in self.iter_articles(pmids)}
+        return [articles[pmid] for pmid in pmids if pmid in articles]
+
+    async def efetch_abstracts(self, pmids):
+        return [article.to_text() for article in await self.efetch_articles(pmids)]
+
+_shared_api = None
+
+def get_pubmed_api():
+    """
+    Retorna o cliente PubMed compartilhado pelo processo (pool de conexões e limitador únicos),
+    ou o espelho local se PUBMED_MIRROR_PATH estiver definida.
+    """
+    global _shared_api
+    if _shared_api is None:
+        if os.getenv("PUBMED_MIRROR_PATH"):
+            from utils.pubmed_mirror import LocalPubmedAPI  # importação tardia: pubmed_mirror importa este módulo
+            _shared_api = LocalPubmedAPI()
+        else:
+            _shared_api = PubmedAPI()
+    return _shared_api
+
+async def close_pubmed_api():
+    global _shared_api
+    if _shared_api is not None:
+        await _shared_api.aclose()
+        _shared_api = None
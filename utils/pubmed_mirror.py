@@ -0,0 +1,336 @@
+"""
+Espelho local do PubMed: ingere os arquivos baseline/updatefile do NCBI (XML, gzipado ou não)
+em um índice SQLite FTS5 e os serve pela mesma interface de PubmedAPI.
+
+Ingestão (a partir da raiz do repositório):
+    python -m utils.pubmed_mirror --db mirror.sqlite3 baseline/ updatefiles/
+Uso pelo serviço: PUBMED_MIRROR_PATH=mirror.sqlite3
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from utils.metrics import stage
+from utils.pubmed_api import EfetchError, SearchResult
+from utils.pubmed_xml import ArticleStreamParser, PubmedArticle
+from utils.query_parser import Group, QuerySyntaxError, parse, simplify
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+CHUNK_SIZE = 1 << 20
+
+# Tags de campo do PubMed com equivalente nas colunas do índice; as demais buscam em todas
+FIELD_COLUMNS = {
+    "ti": "title",
+    "title": "title",
+    "ab": "abstract",
+    "abstract": "abstract",
+    "tiab": "title abstract",
+    "title/abstract": "title abstract",
+    "mh": "mesh",
+    "mesh": "mesh",
+    "majr": "mesh",
+}
+
+def _fts_term(term):
+    prefix = term.text.endswith("*")
+    words = WORD_RE.findall(term.text.rstrip("*"))
+    if not words:
+        raise QuerySyntaxError(f"Termo sem palavras indexáveis: {term.text}")
+    star = "*" if prefix else ""
+    if term.quoted:
+        expr = '"' + " ".join(words) + '"' + star
+    else:
+        # Termos sem aspas (mapeamento automático no PubMed): todas as palavras, em qualquer ordem
+        expr = " AND ".join(f'"{word}"' for word in words) + star
+        if len(words) > 1:
+            expr = f"({expr})"
+    columns = FIELD_COLUMNS.get((term.tag or "").lower())
+    if term.tag and columns is None:
+        logger.debug(f"Tag [{term.tag}] sem equivalente no espelho; buscando em todos os campos")
+    return f"{{{columns}}} : {expr}" if columns else expr
+
+def _fts_node(node):
+    if not isinstance(node, Group):
+        return _fts_term(node)
+    # O PubMed avalia da esquerda para a direita; o FTS5 dá precedência a NOT > AND > OR
+    expr = _fts_node(node.operands[0])
+    for operator, operand in zip(node.operators, node.operands[1:]):
+        expr = f"({expr}) {operator} ({_fts_node(operand)})"
+    return expr
+
+def to_fts_query(query):
+    """
+    Traduz uma query booleana do PubMed em expressão MATCH do FTS5. Levanta QuerySyntaxError se inválida.
+    """
+    return _fts_node(simplify(parse(query)))
+
+def parse_file(path):
+    """
+    Lê um arquivo baseline/updatefile e retorna (nome, artigos, PMIDs removidos). Executado nos
+    processos de ingestão.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    parser = ArticleStreamParser()
+    articles = []
+    with opener(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            articles.extend(parser.feed(chunk))
+    articles.extend(parser.close())
+    return os.path.basename(path), articles, parser.deleted
+
+def find_files(paths):
+    """
+    Expande diretórios em seus arquivos .xml/.xml.gz, em ordem de nome (a ordem de publicação do NCBI).
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in os.listdir(path) if name.endswith((".xml", ".xml.gz"))
+            )
+        else:
+            files.append(path)
+    return sorted(files, key=os.path.basename)
+
+class PubmedMirror:
+    """
+    Índice local: registros dos artigos (JSON) e tabela FTS5 com título, abstract e MeSH,
+    usando o PMID como rowid. Atualizações substituem o registro; <DeleteCitation> o remove.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS articles (pmid INTEGER PRIMARY KEY, record TEXT NOT NULL)")
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5("
+            "title, abstract, mesh, tokenize='unicode61 remove_diacritics 2')"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "name TEXT PRIMARY KEY, articles INTEGER NOT NULL, deleted INTEGER NOT NULL, ingested_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def ingested(self):
+        return {row[0] for row in self.conn.execute("SELECT name FROM files")}
+
+    def ingest(self, paths, workers=None):
+        """
+        Ingere os arquivos ainda não processados: o parsing roda em paralelo em `workers`
+        processos e a gravação, na ordem dos arquivos, neste processo. Retorna o total de artigos gravados.
+        """
+        done = self.ingested()
+        pending = [path for path in find_files(paths) if os.path.basename(path) not in done]
+        workers = workers or os.cpu_count() or 1
+        logger.info(f"Ingestão: {len(pending)} arquivos ({len(done)} já processados), {workers} processos")
+        total = 0
+        with ProcessPoolExecutor(workers) as pool:
+            queue = deque()
+            files = iter(pending)
+            # Janela limitada de arquivos em processamento, para não acumular artigos na memória
+            for path in files:
+                queue.append(pool.submit(parse_file, path))
+                if len(queue) >= 2 * workers:
+                    break
+            while queue:
+                name, articles, deleted = queue.popleft().result()
+                next_path = next(files, None)
+                if next_path is not None:
+                    queue.append(pool.submit(parse_file, next_path))
+                self._apply(name, articles, deleted)
+                total += len(articles)
+                logger.info(f"{name}: {len(articles)} artigos, {len(deleted)} removidos")
+        return total
+
+    def _apply(self, name, articles, deleted):
+        with self._lock:
+            with self.conn:
+                pmids = [(int(pmid),) for pmid in deleted] + [(int(article.pmid),) for article in articles]
+                self.conn.executemany("DELETE FROM articles WHERE pmid = ?", pmids)
+                self.conn.executemany("DELETE FROM articles_fts WHERE rowid = ?", pmids)
+                self.conn.executemany(
+                    "INSERT INTO articles (pmid, record) VALUES (?, ?)",
+                    [(int(article.pmid), json.dumps(article.to_dict())) for article in articles],
+                )
+                self.conn.executemany(
+                    "INSERT INTO articles_fts (rowid, title, abstract, mesh) VALUES (?, ?, ?, ?)",
+                    [
+                        (int(article.pmid), article.title, article.abstract, " ; ".join(article.mesh_terms))
+                        for article in articles
+                    ],
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO files (name, articles, deleted, ingested_at) VALUES (?, ?, ?, ?)",
+                    (name, len(articles), len(deleted), time.time()),
+                )
+
+    def search(self, match, limit=None):
+        """
+        Retorna (PMIDs ordenados por relevância BM25, total de resultados); limit=None traz todos.
+        """
+        with self._lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM articles_fts WHERE articles_fts MATCH ?", (match,)).fetchone()[0]
+            rows = self.conn.execute(
+                "SELECT rowid FROM articles_fts WHERE articles_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, -1 if limit is None else limit),
+            ).fetchall()
+        return [str(row[0]) for row in rows], count
+
+    def page(self, match, before=None, limit=200):
+        """
+        Próxima página de PMIDs da busca em ordem decrescente (mais recentes primeiro), a partir
+        do PMID `before` (exclusive): paginação por chave, sem OFFSET nem ordenação por relevância.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT rowid FROM articles_fts WHERE articles_fts MATCH ? AND rowid < ? ORDER BY rowid DESC LIMIT ?",
+                (match, int(before) if before is not None else 2 ** 63 - 1, limit),
+            ).fetchall()
+        return [str(row[0]) for row in rows]
+
+    def count(self, match):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM articles_fts WHERE articles_fts MATCH ?", (match,)).fetchone()[0]
+
+    def get_many(self, pmids):
+        if not pmids:
+            return {}
+        placeholders = ",".join("?" * len(pmids))
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT pmid, record FROM articles WHERE pmid IN ({placeholders})", [int(pmid) for pmid in pmids]
+            ).fetchall()
+        return {str(pmid): PubmedArticle.from_dict(json.loads(record)) for pmid, record in rows}
+
+    def close(self):
+        self.conn.close()
+
+class LocalPubmedAPI:
+    """
+    Substituto de PubmedAPI servido pelo espelho local (PUBMED_MIRROR_PATH): mesmos métodos
+    usados pelo buscador, pelo pipeline e pela API, sem rede nem limite de requisições.
+    """
+    search_cache = None
+
+    def __init__(self, path=None, mirror=None):
+        self.mirror = mirror or PubmedMirror(path or os.getenv("PUBMED_MIRROR_PATH"))
+        self.retmax = int(os.getenv("PUBMED_RETMAX", "20"))
+
+    def _match(self, query):
+        try:
+            return to_fts_query(query)
+        except QuerySyntaxError as e:
+            logger.error(f"Query inválida, busca local não executada ({e}): {query}")
+            return None
+
+    async def _search(self, query, limit):
+        match = self._match(query)
+        if match is None:
+            return SearchResult()
+        try:
+            with stage("esearch"):
+                pmids, count = await asyncio.to_thread(self.mirror.search, match, limit)
+        except sqlite3.Error as e:
+            logger.error(f"Erro na busca local: {e}")
+            return SearchResult()
+        logger.info(f"PMIDs encontrados (espelho local): {len(pmids)} de {count}")
+        return SearchResult(pmids=pmids, count=count)
+
+    async def esearch(self, query, retmax=None):
+        return await self._search(query, retmax or self.retmax)
+
+    async def esearch_history(self, query):
+        """
+        Equivalente local do History server: o SearchResult traz apenas o Count e, em query_key,
+        a expressão FTS5 que harvest pagina; os PMIDs não são carregados de uma vez.
+        Levanta QuerySyntaxError se a query for inválida.
+        """
+        match = to_fts_query(query)
+        count = await self.count(query)
+        return SearchResult(count=count, query_key=match)
+
+    async def count(self, query):
+        match = self._match(query)
+        if match is None:
+            return 0
+        try:
+            with stage("count"):
+                return await asyncio.to_thread(self.mirror.count, match)
+        except sqlite3.Error as e:
+            logger.error(f"Erro na contagem local: {e}")
+            return 0
+
+    async def count_many(self, queries):
+        return list(await asyncio.gather(*(self.count(query) for query in queries)))
+
+    async def iter_articles(self, pmids, raise_errors=False):
+        try:
+            with stage("efetch", pmids=len(pmids)):
+                found = await asyncio.to_thread(self.mirror.get_many, pmids)
+        except sqlite3.Error as e:
+            logger.error(f"Erro na leitura local de artigos: {e}")
+            if raise_errors:
+                raise EfetchError(str(e)) from e
+            return
+        for pmid in pmids:
+            if pmid in found:
+                yield found[pmid]
+
+    async def efetch_articles(self, pmids):
+        return [article async for article in self.iter_articles(pmids)]
+
+    async def efetch_abstracts(self, pmids):
+        return [article.to_text() for article in await self.efetch_articles(pmids)]
+
+    async def harvest(self, history, batch_size=200, max_records=None, concurrency=None):
+        """
+        Percorre o resultado de esearch_history em páginas de `batch_size` PMIDs (mais recentes primeiro).
+        """
+        total = history.count if max_records is None else min(history.count, max_records)
+        before, sent = None, 0
+        while history.query_key and sent < total:
+            pmids = await asyncio.to_thread(self.mirror.page, history.query_key, before, min(batch_size, total - sent))
+            if not pmids:
+                break
+            async for article in self.iter_articles(pmids):
+                yield article
+            before, sent = pmids[-1], sent + len(pmids)
+
+    def health(self):
+        try:
+            self.mirror.conn.execute("SELECT 1 FROM files LIMIT 1")
+            return {"pubmed_mirror": True}
+        except sqlite3.Error:
+            return {"pubmed_mirror": False}
+
+    async def aclose(self):
+        self.mirror.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingere arquivos baseline/updatefile do PubMed no espelho local")
+    parser.add_argument("paths", nargs="+", help="arquivos .xml/.xml.gz ou diretórios")
+    parser.add_argument("--db", default=os.getenv("PUBMED_MIRROR_PATH", "pubmed_mirror.sqlite3"))
+    parser.add_argument("--workers", type=int, default=None, help="processos de parsing (padrão: núcleos da CPU)")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    mirror = PubmedMirror(args.db)
+    try:
+        total = mirror.ingest(args.paths, args.workers)
+    finally:
+        mirror.close()
+    print(f"{total} artigos gravados em {args.db}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional, Tuple
+
+@dataclass
+class PubmedArticle:
+    pmid: str
+    title: str = ""
+    abstract_sections: List[Tuple[str, str]] = field(default_factory=list)
+    mesh_terms: List[str] = field(default_factory=list)
+    year: Optional[str] = None
+    journal: str = ""
+
+    @property
+    def abstract(self):
+        return "\n".join(f"{label}: {text}" if label else text for label, text in self.abstract_sections)
+
+    def to_text(self):
+        """
+        Representação em texto (título + abstract) usada nos prompts e na saída do CLI.
+        """
+        return f"{self.title}\n\n{self.abstract}".strip()
+
+    def to_dict(self):
+        data = asdict(self)
+        data["abstract"] = self.abstract
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            pmid=data["pmid"],
+            title=data.get("title", ""),
+            abstract_sections=[tuple(section) for section in data.get("abstract_sections", [])],
+            mesh_terms=data.get("mesh_terms", []),
+            year=data.get("year"),
+            journal=data.get("journal", ""),
+        )
+
+def _text(elem):
+    return "".join(elem.itertext()).strip() if elem is not None else ""
+
+def parse_article(elem):
+    """
+    Converte um elemento <PubmedArticle> em PubmedArticle.
+    """
+    citation = elem.find("MedlineCitation")
+    article = citation.find("Article")
+    sections = [
+        (section.get("Label", ""), _text(section))
+        for section in article.findall("Abstract/AbstractText")
+    ]
+    pub_date = article.find("Journal/JournalIssue/PubDate")
+    year = None
+    if pub_date is not None:
+        year = pub_date.findtext("Year") or (pub_date.findtext("MedlineDate") or "")[:4] or None
+    return PubmedArticle(
+        pmid=citation.findtext("PMID"),
+        title=_text(article.find("ArticleTitle")),
+        abstract_sections=[(label, text) for label, text in sections if text],
+        mesh_terms=[_text(name) for name in citation.findall("MeshHeadingList/MeshHeading/DescriptorName")],
+        year=year,
+        journal=article.findtext("Journal/Title") or "",
+    )
+
+class ArticleStreamParser:
+    """
+    Parser incremental para respostas efetch e arquivos baseline/updatefile em XML: recebe
+    blocos de bytes e devolve os artigos completos já lidos, descartando os elementos
+    processados para manter a memória estável. PMIDs de <DeleteCitation> ficam em `deleted`.
+    """
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self.deleted = []
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+        return self._collect()
+
+    def close(self):
+        self._parser.close()
+        return self._collect()
+
+    def _collect(self):
+        articles = []
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+            elif elem.tag == "PubmedArticle":
+                articles.append(parse_article(elem))
+                self._root.clear()
+            elif elem.tag == "DeleteCitation":
+                self.deleted.extend(pmid.text for pmid in elem.findall("PMID"))
+                self._root.clear()
+        return articles
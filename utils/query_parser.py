@@ -0,0 +1,237 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+
+TOKEN_RE = re.compile(
+    r'\s*(?:(?P<lparen>\()|(?P<rparen>\))|(?P<phrase>"[^"]*")(?P<phrase_tag>\[[^\]]*\])?'
+    r'|(?P<word>[^\s()"\[\]]+)(?P<word_tag>\[[^\]]*\])?|(?P<quote>")|(?P<bracket>[\[\]]))'
+)
+OPERATORS = {"AND", "OR", "NOT"}
+QUOTE_CHARS = str.maketrans({"“": '"', "”": '"', "„": '"', "‘": "'", "’": "'"})
+
+class QuerySyntaxError(ValueError):
+    pass
+
+@dataclass
+class Term:
+    """
+    Termo de busca: palavra(s) sem aspas (mapeamento automático do PubMed), frase entre
+    aspas ou termo com wildcard, com tag de campo opcional (ex.: [tiab]).
+    """
+    text: str
+    quoted: bool = False
+    tag: Optional[str] = None
+
+    def words(self):
+        return self.text.lower().split()
+
+@dataclass
+class Group:
+    """
+    Sequência de operandos ligados por operadores booleanos, avaliada da esquerda para a
+    direita como no PubMed. `operators[i]` liga `operands[i]` a `operands[i + 1]`.
+    """
+    operands: List[Union["Group", Term]] = field(default_factory=list)
+    operators: List[str] = field(default_factory=list)
+
+Node = Union[Group, Term]
+
+def tokenize(query):
+    query = query.translate(QUOTE_CHARS).strip()
+    tokens = []
+    position = 0
+    while position < len(query):
+        match = TOKEN_RE.match(query, position)
+        if match is None or match.end() == position:
+            break
+        position = match.end()
+        if match.group("lparen"):
+            tokens.append(("(", None))
+        elif match.group("rparen"):
+            tokens.append((")", None))
+        elif match.group("phrase"):
+            text = match.group("phrase")[1:-1].strip()
+            if not text:
+                raise QuerySyntaxError("Frase vazia entre aspas")
+            tokens.append(("term", Term(text, quoted=True, tag=_tag(match.group("phrase_tag")))))
+        elif match.group("word"):
+            word = match.group("word")
+            if word.upper() in OPERATORS and not match.group("word_tag"):
+                tokens.append(("op", word.upper()))
+            else:
+                tokens.append(("term", Term(word, tag=_tag(match.group("word_tag")))))
+        elif match.group("quote"):
+            raise QuerySyntaxError("Aspas desbalanceadas")
+        elif match.group("bracket"):
+            raise QuerySyntaxError("Colchetes fora de uma tag de campo")
+    return tokens
+
+def _tag(raw):
+    return raw[1:-1].strip() if raw else None
+
+def parse(query):
+    """
+    Converte uma query booleana do PubMed em AST. Levanta QuerySyntaxError se inválida.
+    Palavras adjacentes sem aspas formam um único termo; demais operandos adjacentes
+    sem operador são ligados por AND implícito.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        raise QuerySyntaxError("Query vazia")
+    node, position = _parse_group(tokens, 0, depth=0)
+    if position != len(tokens):
+        raise QuerySyntaxError("Parêntese de fechamento sem abertura")
+    return node
+
+def _parse_group(tokens, position, depth):
+    group = Group()
+    expect_operand = True
+    while position < len(tokens):
+        kind, value = tokens[position]
+        if kind == ")":
+            if depth == 0:
+                raise QuerySyntaxError("Parêntese de fechamento sem abertura")
+            break
+        if kind == "op":
+            if expect_operand:
+                raise QuerySyntaxError(f"Operador {value} sem operando à esquerda")
+            group.operators.append(value)
+            expect_operand = True
+            position += 1
+            continue
+        if kind == "(":
+            operand, position = _parse_group(tokens, position + 1, depth + 1)
+            if position >= len(tokens) or tokens[position][0] != ")":
+                raise QuerySyntaxError("Parêntese de abertura sem fechamento")
+            position += 1
+        else:
+            operand = value
+            position += 1
+        if not expect_operand:
+            previous = group.operands[-1]
+            if isinstance(previous, Term) and isinstance(operand, Term) and not (
+                previous.quoted or operand.quoted or previous.tag
+            ):
+                group.operands[-1] = Term(f"{previous.text} {operand.text}", tag=operand.tag)
+                continue
+            group.operators.append("AND")
+        group.operands.append(operand)
+        expect_operand = False
+    if not group.operands:
+        raise QuerySyntaxError("Grupo vazio")
+    if expect_operand:
+        raise QuerySyntaxError(f"Operador {group.operators[-1]} sem operando à direita")
+    if len(group.operands) == 1 and depth > 0 and isinstance(group.operands[0], Group):
+        return group.operands[0], position
+    return group, position
+
+# Tags de vocabulário controlado: o termo mais específico não contém as palavras do mais geral
+# como texto (ex.: "heart"[mh] não inclui "heart diseases"[mh]).
+MESH_TAGS = {"mh", "mesh", "majr", "mesh terms", "mesh major topic", "sh", "subheading"}
+
+def _covers(general, specific):
+    """
+    Verdadeiro se todo resultado de `specific` também é resultado de `general` num grupo OR:
+    mesma tag e `general` termina em wildcard que cobre `specific`, ou `specific` é uma frase
+    entre aspas em que as palavras de `general` aparecem em sequência. Termos sem aspas passam
+    pelo mapeamento automático do PubMed (heart attack -> myocardial infarction) e podem
+    trazer artigos sem essas palavras, por isso nunca são cobertos por palavras.
+    """
+    if (general.tag or "").lower() != (specific.tag or "").lower():
+        return False
+    if general.text.endswith("*") and " " not in general.text:
+        return specific.text.lower().startswith(general.text[:-1].lower()) and " " not in specific.text
+    if not specific.quoted or (specific.tag or "").lower() in MESH_TAGS:
+        return False
+    general_words, specific_words = general.words(), specific.words()
+    if len(general_words) >= len(specific_words):
+        return False
+    n = len(general_words)
+    return any(specific_words[i:i + n] == general_words for i in range(len(specific_words) - n + 1))
+
+def _drop_covered(operands):
+    """
+    Remove de um grupo OR os termos cobertos por outro termo mantido, em uma passada: um termo
+    coberto por um já mantido é descartado; um termo que cobre mantidos os substitui. Termos
+    que se cobrem mutuamente (ex.: cat* e "cat*") ficam com o primeiro, nunca com nenhum.
+    """
+    kept = []
+    for operand in operands:
+        if isinstance(operand, Term):
+            if any(isinstance(other, Term) and _covers(other, operand) for other in kept):
+                continue
+            kept = [other for other in kept if not (isinstance(other, Term) and _covers(operand, other))]
+        kept.append(operand)
+    return kept
+
+def simplify(node, sort=False):
+    """
+    Remove operandos duplicados e sinônimos redundantes de grupos OR (ex.: "stroke" OR
+    "acute stroke" -> "stroke"), desfaz parênteses desnecessários e, com sort=True, ordena
+    operandos de grupos comutativos (só OR ou só AND) para gerar uma forma canônica.
+    """
+    if isinstance(node, Term):
+        return node
+    operands = [simplify(operand, sort) for operand in node.operands]
+    operators = list(node.operators)
+    if operators and len(set(operators)) == 1 and operators[0] in ("OR", "AND"):
+        operator = operators[0]
+        flat = []
+        for operand in operands:
+            if isinstance(operand, Group) and set(operand.operators) == {operator}:
+                flat.extend(operand.operands)
+            else:
+                flat.append(operand)
+        seen, unique = set(), []
+        for operand in flat:
+            key = format_query(operand).lower()
+            if key not in seen:
+                seen.add(key)
+                unique.append(operand)
+        if operator == "OR":
+            unique = _drop_covered(unique)
+        if sort:
+            unique.sort(key=lambda operand: format_query(operand).lower())
+        operands, operators = unique, [operator] * (len(unique) - 1)
+    if not operands:
+        raise QuerySyntaxError("Grupo vazio")
+    if len(operands) == 1:
+        return operands[0]
+    return Group(operands, operators)
+
+def format_query(node, top_level=True):
+    if isinstance(node, Term):
+        text = f'"{node.text}"' if node.quoted else node.text
+        return f"{text}[{node.tag}]" if node.tag else text
+    parts = [format_query(node.operands[0], top_level=False)]
+    for operator, operand in zip(node.operators, node.operands[1:]):
+        parts.append(f"{operator} {format_query(operand, top_level=False)}")
+    text = " ".join(parts)
+    return text if top_level else f"({text})"
+
+def clean_query(query):
+    """
+    Valida e simplifica a query mantendo a ordem dos termos. Levanta QuerySyntaxError se inválida.
+    """
+    return format_query(simplify(parse(query)))
+
+def canonical_query(query):
+    """
+    Forma canônica (minúsculas, sem redundâncias, grupos comutativos ordenados) para chaves de cache.
+    """
+    return format_query(simplify(_lowercase(parse(query)), sort=True))
+
+def subclauses(query):
+    """
+    Sub-expressões de primeiro nível da query (operandos do grupo raiz), já simplificadas.
+    Retorna lista vazia se a query tiver um único operando.
+    """
+    node = simplify(parse(query))
+    if isinstance(node, Term):
+        return []
+    return [format_query(operand) for operand in node.operands]
+
+def _lowercase(node):
+    if isinstance(node, Term):
+        return Term(node.text.lower(), node.quoted, node.tag.lower() if node.tag else None)
+    return Group([_lowercase(operand) for operand in node.operands], list(node.operators))
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from utils.abstract_cache import default_cache_dir
+from utils.query_parser import QuerySyntaxError, canonical_query
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query):
+    """
+    Chave canônica de uma query: forma canônica do parser (caixa, aspas, redundâncias e grupos
+    OR/AND ordenados); para queries inválidas, apenas espaços e caixa normalizados.
+    """
+    try:
+        return canonical_query(query)
+    except QuerySyntaxError:
+        return " ".join(query.lower().split())
+
+class SearchCache:
+    """
+    Cache de resultados do esearch em dois níveis (memória e SQLite) com TTL e contadores de acerto.
+    A memória é consultada direto no event loop; o SQLite, via asyncio.to_thread. Entradas
+    expiradas são apagadas no disco no máximo a cada `purge_interval` segundos.
+    """
+    def __init__(self, path=None, ttl=None, max_memory_entries=1024, purge_interval=300):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "esearch.sqlite3")
+        self.ttl = ttl if ttl is not None else float(os.getenv("ESEARCH_CACHE_TTL", "86400"))
+        self.max_memory_entries = max_memory_entries
+        self.purge_interval = purge_interval
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS esearch (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_esearch_expires_at ON esearch(expires_at)")
+        self.conn.commit()
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, key):
+        with self._lock:
+            return self.conn.execute("SELECT value, expires_at FROM esearch WHERE key = ?", (key,)).fetchone()
+
+    def _save(self, key, value, expires_at, purge):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO esearch (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            if purge:
+                self.conn.execute("DELETE FROM esearch WHERE expires_at <= ?", (time.time(),))
+            self.conn.commit()
+
+    async def get(self, key):
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry and entry[0] > now:
+            self._memory.move_to_end(key)
+            self.hits_memory += 1
+            return entry[1]
+        row = await asyncio.to_thread(self._load, key)
+        if row and row[1] > now:
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            self.hits_disk += 1
+            return value
+        self.misses += 1
+        return None
+
+    async def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, value, expires_at)
+        purge = now >= self._next_purge
+        if purge:
+            self._next_purge = now + self.purge_interval
+        await asyncio.to_thread(self._save, key, json.dumps(value), expires_at, purge)
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        self.conn.close()
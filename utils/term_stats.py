@@ -0,0 +1,133 @@
+import re
+from collections import Counter
+import numpy as np
+from scipy import sparse
+
+WORD_RE = re.compile(r"\b[a-z][a-z0-9-]{3,}\b")
+ACRONYM_RE = re.compile(r"\b([a-z]*[A-Z][A-Za-z]*[A-Z]+)s?\b")
+DEFINITION_RE = re.compile(r"((?:[A-Za-z][\w'-]*[\s,]+){1,8})\(([a-z]*[A-Z][A-Za-z]*[A-Z]+)s?\)")
+STOPWORDS = {
+    "with", "from", "this", "that", "these", "those", "study", "studies", "patients", "patient", "were",
+    "was", "have", "been", "which", "their", "there", "than", "into", "also", "after", "between", "among",
+    "during", "while", "compared", "results", "methods", "background", "conclusions", "conclusion",
+    "objective", "objectives", "significant", "significantly", "using", "used", "based", "group", "groups",
+    "more", "most", "less", "both", "each", "other", "such", "when", "where", "they", "them", "will",
+    "versus", "within", "without", "including", "total", "years", "year", "data", "analysis",
+}
+
+# Rótulos de seções de abstracts estruturados, que não são siglas
+SECTION_LABELS = {
+    "BACKGROUND", "INTRODUCTION", "OBJECTIVE", "OBJECTIVES", "PURPOSE", "AIM", "AIMS", "DESIGN", "SETTING",
+    "PARTICIPANTS", "INTERVENTIONS", "MEASUREMENTS", "METHODS", "RESULTS", "FINDINGS", "CONCLUSION",
+    "CONCLUSIONS", "INTERPRETATION", "IMPORTANCE", "FUNDING",
+}
+
+def tokenize(text):
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+def _long_form(acronym, candidate):
+    """
+    Algoritmo de Schwartz & Hearst: casa as letras da sigla, da direita para a esquerda,
+    com caracteres da forma candidata; a primeira letra deve iniciar uma palavra.
+    """
+    short_index, long_index = len(acronym) - 1, len(candidate) - 1
+    while short_index >= 0:
+        char = acronym[short_index].lower()
+        if not char.isalnum():
+            short_index -= 1
+            continue
+        while long_index >= 0 and (
+            candidate[long_index].lower() != char
+            or (short_index == 0 and long_index > 0 and candidate[long_index - 1].isalnum())
+        ):
+            long_index -= 1
+        if long_index < 0:
+            return None
+        long_index -= 1
+        short_index -= 1
+    start = candidate.rfind(" ", 0, long_index + 1) + 1
+    return candidate[start:]
+
+def find_acronyms(text):
+    """
+    Extrai pares sigla -> forma longa do tipo "subarachnoid hemorrhage (SAH)".
+    """
+    expansions = {}
+    for prefix, acronym in DEFINITION_RE.findall(text):
+        words = prefix.split()
+        window = min(len(acronym) + 5, len(acronym) * 2)
+        long_form = _long_form(acronym, " ".join(words[-window:]).rstrip(","))
+        if long_form and len(long_form) > len(acronym):
+            expansions.setdefault(acronym, long_form.lower())
+    return expansions
+
+class TermStats:
+    """
+    Estatísticas de termos vetorizadas (matriz documento-termo esparsa) sobre um conjunto de
+    abstracts: pesos BM25, saliência dos termos, siglas e relevância de cada abstract a uma query.
+    """
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = list(documents)
+        self.vocabulary = {}
+        indptr, indices, data = [0], [], []
+        for document in self.documents:
+            for term, count in Counter(tokenize(document)).items():
+                indices.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                data.append(count)
+            indptr.append(len(indices))
+        self.terms = np.array(sorted(self.vocabulary, key=self.vocabulary.get), dtype=object)
+        shape = (len(self.documents), len(self.vocabulary))
+        tf = sparse.csr_matrix((np.array(data, dtype=float), indices, indptr), shape=shape)
+
+        doc_lengths = np.asarray(tf.sum(axis=1)).ravel()
+        avg_length = doc_lengths.mean() if len(doc_lengths) and doc_lengths.mean() > 0 else 1.0
+        df = np.bincount(tf.indices, minlength=shape[1])
+        n = max(len(self.documents), 1)
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+
+        # BM25: tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)), multiplicado pelo idf
+        norm = k1 * (1 - b + b * doc_lengths / avg_length)
+        weights = tf.copy()
+        row_norm = np.repeat(norm, np.diff(tf.indptr))
+        weights.data = tf.data * (k1 + 1) / (tf.data + row_norm) * self.idf[tf.indices]
+        self.weights = weights
+
+    def salient_terms(self, top_n=10, exclude=()):
+        """
+        Termos com maior peso BM25 somado sobre os documentos, em ordem determinística.
+        """
+        if not self.vocabulary:
+            return []
+        scores = np.asarray(self.weights.sum(axis=0)).ravel()
+        order = np.lexsort((self.terms, -scores))
+        excluded = {term.lower() for term in exclude}
+        return [self.terms[i] for i in order if self.terms[i] not in excluded][:top_n]
+
+    def acronyms(self, top_n=10):
+        """
+        Siglas mais frequentes nos documentos, com a forma longa quando definida no texto.
+        """
+        counts = Counter()
+        expansions = {}
+        for document in self.documents:
+            counts.update(acronym for acronym in ACRONYM_RE.findall(document) if acronym not in SECTION_LABELS)
+            for acronym, long_form in find_acronyms(document).items():
+                expansions.setdefault(acronym, long_form)
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top_n]
+        return [(acronym, expansions.get(acronym)) for acronym, _ in ranked]
+
+    def relevance(self, query):
+        """
+        Pontuação BM25 de cada documento para os termos da query.
+        """
+        query_vector = np.zeros(len(self.vocabulary))
+        for term in tokenize(query):
+            if term in self.vocabulary:
+                query_vector[self.vocabulary[term]] = 1.0
+        return self.weights @ query_vector
+
+    def rank(self, query):
+        """
+        Índices dos documentos ordenados por relevância decrescente (empates mantêm a ordem original).
+        """
+        return [int(i) for i in np.argsort(-self.relevance(query), kind="stable")]